@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.db import router
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from ..base.cache import Namespace
+
+# User columns keyed by `USER_ID_FIELD`, dropped by the User save/delete signals (see signals.py)
+user_cache = Namespace('users', timeout=settings.USER_CACHE_TIMEOUT)
+
+# Claim holding `User.token_version`, see `get_tokens_for_user`
+TOKEN_VERSION_CLAIM = 'ver'
+
+# Columns of the cached users, the other fields are loaded from the database when first read
+CACHED_USER_FIELDS = ('id', 'is_active', 'is_separated', 'is_superuser', 'is_staff', 'token_version')
+
+
+def get_cached_user(user_model, user_id):
+    """
+    The user with `USER_ID_FIELD` == `user_id`, or None. Only `CACHED_USER_FIELDS` are loaded and
+    they can be `USER_CACHE_TIMEOUT` seconds old, so reload the row before saving it.
+    """
+    # In model order, as `from_db` expects for partial rows
+    names = [field.attname for field in user_model._meta.concrete_fields
+             if field.attname in CACHED_USER_FIELDS or field.name == api_settings.USER_ID_FIELD]
+    values = user_cache.get(user_id)
+    if values is None:
+        values = user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list(*names).first()
+        if values is None:
+            return None
+        user_cache.set(user_id, values)
+    return user_model.from_db(router.db_for_read(user_model), names, values)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    `JWTAuthentication` that, with `USER_CACHE_ENABLED`, reads the user from `user_cache` instead of
+    querying it on every request. The cache must be shared by all processes, otherwise the save/delete
+    signals of one worker wouldn't reach the others.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CachedJWTAuthentication, self).__init__(*args, **kwargs)
+        if settings.USER_CACHE_ENABLED and not user_cache.is_shared:
+            raise ImproperlyConfigured('USER_CACHE_ENABLED needs a cache shared by all processes, '
+                                       'set CACHE_BACKEND to one (e.g. redis).')
+
+    def get_user(self, validated_token):
+        if not settings.USER_CACHE_ENABLED:
+            return super(CachedJWTAuthentication, self).get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = get_cached_user(self.user_model, user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+def get_token_version(user_id):
+    """Current `token_version` of the user, None if the user doesn't exist."""
+    return user_cache.get_or_set(
+        'version:%s' % user_id,
+        lambda: get_user_model().objects.filter(
+            **{api_settings.USER_ID_FIELD: user_id}
+        ).values_list('token_version', flat=True).first()
+    )
+
+
+class ClaimsUser(TokenUser):
+    """
+    `TokenUser` answering `is_superuser`, `is_separated` and `is_active` from the token claims.
+    It has no other user fields; use it only where permissions need nothing more.
+    """
+
+    @cached_property
+    def is_superuser(self):
+        return self.token.get('is_superuser', False)
+
+    @cached_property
+    def is_separated(self):
+        return self.token.get('is_separated', False)
+
+    @cached_property
+    def is_active(self):
+        return self.token.get('is_active', False)
+
+
+class TokenUserAuthentication(JWTStatelessUserAuthentication):
+    """
+    Opt-in for read-only / permission-only viewsets (`authentication_classes = (TokenUserAuthentication,)`):
+    builds `TOKEN_USER_CLASS` from the claims instead of loading the user. Only the user's
+    `token_version` is checked, through the cache, so tokens issued before a password change,
+    deactivation or separation are rejected.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        version = validated_token.get(TOKEN_VERSION_CLAIM)
+        if version is None or version != get_token_version(user_id):
+            raise AuthenticationFailed(_("Token is no longer valid"), code="token_not_valid")
+        if not validated_token.get('is_active', False):
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return api_settings.TOKEN_USER_CLASS(validated_token)
@@ -0,0 +1,160 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .search import normalize
+
+# User fields whose words are indexed for prefix lookups
+DIRECTORY_FIELDS = ('first_name', 'middle_name', 'last_name', 'email', 'mobile', 'username')
+
+
+def get_terms(values):
+    """Every word of the indexed fields, plus the full name so multi-word prefixes match."""
+    terms = set()
+    for name in DIRECTORY_FIELDS:
+        terms.update(normalize(values[name]).split())
+    full_name = normalize(' '.join(values[name] or '' for name in ('first_name', 'middle_name', 'last_name')))
+    if ' ' in full_name:
+        terms.add(full_name)
+    return terms
+
+
+class DirectoryIndex(object):
+    """
+    Immutable prefix index of active users.
+
+    Terms are utf-8 encoded, sorted and concatenated into one `bytes` blob, with their start offsets
+    and user pks in `array`s; display names are stored the same way, ordered by pk. A prefix lookup
+    is a binary search over the offsets followed by a scan of the matching run, so nothing per term
+    lives as a Python object.
+    """
+
+    def __init__(self, entries, names):
+        entries.sort()
+        self.term_blob = b''.join(term for term, pk in entries)
+        self.term_offsets = array('I', [0])
+        self.term_pks = array('I')
+        for term, pk in entries:
+            self.term_offsets.append(self.term_offsets[-1] + len(term))
+            self.term_pks.append(pk)
+
+        names.sort()
+        self.name_pks = array('I', (pk for pk, name in names))
+        encoded = [name.encode('utf8') for pk, name in names]
+        self.name_blob = b''.join(encoded)
+        self.name_offsets = array('I', [0])
+        for name in encoded:
+            self.name_offsets.append(self.name_offsets[-1] + len(name))
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.term_pks)
+
+    def term(self, position):
+        return self.term_blob[self.term_offsets[position]:self.term_offsets[position + 1]]
+
+    def lower_bound(self, prefix):
+        low, high = 0, len(self.term_pks)
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def search(self, prefix, exclude, limit):
+        """Pks of users with a term starting with `prefix`, shortest (closest) terms first."""
+        prefix = prefix.encode('utf8')
+        matches = []
+        seen = set()
+        position = self.lower_bound(prefix)
+        while position < len(self.term_pks) and len(seen) < limit * 4:
+            term = self.term(position)
+            if not term.startswith(prefix):
+                break
+            pk = self.term_pks[position]
+            if pk not in seen and pk not in exclude:
+                seen.add(pk)
+                matches.append((len(term), pk))
+            position += 1
+        return matches
+
+    def get_name(self, pk):
+        position = bisect_left(self.name_pks, pk)
+        if position < len(self.name_pks) and self.name_pks[position] == pk:
+            return self.name_blob[self.name_offsets[position]:self.name_offsets[position + 1]].decode('utf8')
+        return None
+
+
+class UserDirectory(object):
+    """
+    Per-process autocomplete over active users.
+
+    The `DirectoryIndex` is built on first use and again after `AUTOCOMPLETE_INDEX_TTL` seconds or
+    `AUTOCOMPLETE_MAX_PENDING` changes. In between, User saves and deletes of this process are kept
+    in a small overlay that takes precedence over the index.
+    """
+
+    def __init__(self):
+        self.index = None
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def build(self):
+        entries, names = [], []
+        queryset = get_user_model().objects.filter(is_active=True).values('pk', 'display_name', *DIRECTORY_FIELDS)
+        for values in queryset.iterator(chunk_size=5000):
+            entries.extend((term.encode('utf8'), values['pk']) for term in get_terms(values))
+            names.append((values['pk'], values['display_name']))
+        return DirectoryIndex(entries, names)
+
+    def get_index(self):
+        index = self.index
+        if index is None or time.monotonic() - index.built_at > settings.AUTOCOMPLETE_INDEX_TTL or \
+                len(self.pending) > settings.AUTOCOMPLETE_MAX_PENDING:
+            with self.lock:
+                if self.index is index:
+                    self.index, self.pending = self.build(), {}
+                index = self.index
+        return index
+
+    def update(self, user, deleted=False):
+        if self.index is None:
+            return
+        values = {name: getattr(user, name) for name in DIRECTORY_FIELDS}
+        with self.lock:
+            if deleted or not user.is_active:
+                self.pending[user.pk] = None
+            else:
+                self.pending[user.pk] = (get_terms(values), user.display_name)
+
+    def search(self, query, limit=10):
+        """Up to `limit` `{'id', 'name'}` of active users with a word starting with `query`."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        index = self.get_index()
+        pending = dict(self.pending)
+
+        matches = index.search(prefix, pending, limit)
+        for pk, entry in pending.items():
+            if entry is None:
+                continue
+            lengths = [len(term.encode('utf8')) for term in entry[0] if term.startswith(prefix)]
+            if lengths:
+                matches.append((min(lengths), pk))
+        matches.sort()
+
+        results = []
+        for length, pk in matches[:limit]:
+            name = pending[pk][1] if pk in pending else index.get_name(pk)
+            results.append({'id': pk, 'name': name})
+        return results
+
+
+user_directory = UserDirectory()
@@ -1,7 +1,7 @@
 import django_filters
-from django.db.models import Q
 
 from .models import User
+from .search import search_users
 
 
 class UserBasicFilter(django_filters.FilterSet):
@@ -18,8 +18,5 @@ class UserBasicFilter(django_filters.FilterSet):
             'email': ['icontains']
         }
 
-    def custom_filter(self, queryset, value):
-        return queryset.filter(
-            Q(first_name__icontains=value) | Q(last_name__icontains=value) | Q(middle_name__icontains=value) | Q(
-                email__icontains=value) | Q(mobile__icontains=value) | Q(company_name__exact=value) | Q(
-                gstin_no__icontains=value))
+    def custom_filter(self, queryset, name, value):
+        return search_users(queryset, value)
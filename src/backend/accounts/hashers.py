@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """
+    Django's scrypt hasher with the cost taken from `PASSWORD_SCRYPT_WORK_FACTOR`.
+    Hashes made with other parameters are upgraded on the next successful login.
+    """
+    work_factor = settings.PASSWORD_SCRYPT_WORK_FACTOR
+    block_size = 8
+    parallelism = 1
+    # hashlib.scrypt needs 128 * n * r bytes, keep some headroom over its 32 MiB default
+    maxmem = 2 * 128 * work_factor * block_size
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    Django's PBKDF2 hasher with the iterations taken from `PASSWORD_PBKDF2_ITERATIONS`.
+    """
+    iterations = settings.PASSWORD_PBKDF2_ITERATIONS
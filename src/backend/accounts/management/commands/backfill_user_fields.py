@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = ("Recompute User.full_name, display_name and search_text for every user. "
+            "Needed after users are written with queryset.update() / bulk operations, which skip save().")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        batch_size = options['batch_size']
+        derived = list(User.DERIVED_FIELDS)
+        sources = sorted(set(name for fields in User.DERIVED_FIELDS.values() for name in fields))
+        queryset = User.objects.only('pk', *(sources + derived)).order_by('pk')
+
+        updated, batch = 0, []
+        for user in queryset.iterator(chunk_size=batch_size):
+            before = [getattr(user, name) for name in derived]
+            user.update_derived_fields()
+            if [getattr(user, name) for name in derived] != before:
+                batch.append(user)
+            if len(batch) >= batch_size:
+                updated += self.flush(User, batch, derived)
+                batch = []
+        if batch:
+            updated += self.flush(User, batch, derived)
+        self.stdout.write("Updated %s users" % updated)
+
+    @staticmethod
+    def flush(User, batch, derived):
+        with transaction.atomic():
+            User.objects.bulk_update(batch, derived)
+        return len(batch)
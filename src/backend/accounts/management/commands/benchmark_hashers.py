@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, get_hashers
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Report password verifications (logins) per second on one core for each configured hasher."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=2.0, help="Time spent on each hasher")
+        parser.add_argument('--password', default='correct horse battery staple')
+
+    def handle(self, *args, **options):
+        password = options['password']
+        self.stdout.write("PASSWORD_HASHER=%s" % settings.PASSWORD_HASHER)
+        for hasher in get_hashers():
+            encoded = hasher.encode(password, hasher.salt())
+            count, started = 0, time.perf_counter()
+            while True:
+                assert hasher.verify(password, encoded)
+                count += 1
+                elapsed = time.perf_counter() - started
+                if elapsed >= options['seconds']:
+                    break
+            default = ' (default)' if hasher.algorithm == get_hasher().algorithm else ''
+            self.stdout.write("%-28s %8.1f logins/s/core  %7.2f ms/login%s" % (
+                hasher.algorithm, count / elapsed, elapsed / count * 1000, default
+            ))
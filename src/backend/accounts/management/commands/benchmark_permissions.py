@@ -0,0 +1,35 @@
+import timeit
+from types import SimpleNamespace
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+
+from ...permissions import UserPermissions
+
+
+class Command(BaseCommand):
+    help = "Compare per-request permission check overhead of UserPermissions, rebuilt vs compiled plans."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        permission = UserPermissions()
+        request = SimpleNamespace(user=AnonymousUser(), method='GET', GET={})
+        view = SimpleNamespace()
+        actions = sorted(name[:-len('_perms')] for name in dir(UserPermissions) if name.endswith('_perms'))
+
+        def rebuilt():
+            for action in actions:
+                permission.build_permset(action).has_permission(request=request, view=view)
+
+        def compiled():
+            for action in actions:
+                permission.has_action_permission(request, view, action)
+
+        self.stdout.write("%s actions, %s iterations" % (len(actions), iterations))
+        for label, func in (('rebuilt per request', rebuilt), ('compiled plan', compiled)):
+            elapsed = timeit.timeit(func, number=iterations)
+            per_check = elapsed / (iterations * len(actions)) * 1e6
+            self.stdout.write("%-20s %8.3f s  %6.3f us/check" % (label, elapsed, per_check))
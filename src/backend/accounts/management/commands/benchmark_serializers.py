@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...serializers import UserRegisterSerializer
+from ....base.serializers import get_fast_plan
+from ....base.utils.benchmark import best
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Compare UserRegisterSerializer(many=True).data with its values_list() FastPlan. "
+            "Users are created inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000', help="Comma separated user counts")
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        plan = get_fast_plan(UserRegisterSerializer)
+        if plan is None:
+            self.stderr.write("UserRegisterSerializer has no fast plan")
+            return
+
+        for size in [int(size) for size in options['sizes'].split(',')]:
+            try:
+                with transaction.atomic():
+                    self.create_users(User, size)
+                    queryset = User.objects.filter(email__startswith='bench-').order_by('pk')
+                    slow = best(options['repeat'], lambda: UserRegisterSerializer(queryset, many=True).data)
+                    fast = best(options['repeat'], lambda: plan.to_representations(plan.project(queryset)))
+                    self.stdout.write("%7d users  serializer %7.3f s  fast plan %7.3f s  x%.1f" % (
+                        size, slow, fast, slow / fast if fast else 0))
+                    raise Rollback
+            except Rollback:
+                pass
+
+    @staticmethod
+    def create_users(User, size):
+        users = []
+        for index in range(size):
+            user = User(email='bench-%s@example.com' % index, username='bench-%s' % index,
+                        mobile='9%09d' % index, first_name='Bench', last_name='User %s' % index)
+            user.update_derived_fields()
+            users.append(user)
+        User.objects.bulk_create(users, batch_size=2000)
@@ -0,0 +1,52 @@
+import re
+from datetime import date, datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...models import OTPLogin
+
+
+def get_hot_queries(mobile='9999999999', email='user@example.com'):
+    """(label, index expected in the plan or None for any index, queryset)"""
+    User = get_user_model()
+    window = datetime.now() - timedelta(minutes=15)
+    return (
+        ('user by active mobile', 'user_active_mobile_idx', User.objects.filter(is_active=True, mobile=mobile)),
+        ('user by active email', None, User.objects.filter(email=email, is_active=True)),
+        ('user by login identifier', 'lower_idx', User.objects.active_by_identifier(email)),
+        ('otp of the day', 'otplogin_active_mobile_idx',
+         OTPLogin.objects.filter(mobile=mobile, is_active=True, modified_at__gte=date.today())),
+        ('otp to verify', 'otplogin_active_mobile_idx',
+         OTPLogin.objects.filter(mobile=mobile, otp='000000', is_active=True, modified_at__gte=window)),
+    )
+
+
+class Command(BaseCommand):
+    help = ("EXPLAIN the login / OTP lookups and check that they use their indexes. "
+            "On PostgreSQL sequential scans are disabled for the check, so small tables still show the index plan.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help="Exit with an error when a query doesn't use its index")
+        parser.add_argument('--verbose-plans', action='store_true', help="Print the full plans")
+
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for label, index, queryset in get_hot_queries():
+                plan = queryset.explain()
+                if index is None:
+                    uses_index = re.search('index', plan, re.IGNORECASE) is not None
+                else:
+                    uses_index = index in plan
+                self.stdout.write("%-28s %s" % (label, 'index' if uses_index else 'NO INDEX (%s)' % (index or 'any')))
+                if options['verbose_plans'] or not uses_index:
+                    self.stdout.write(plan)
+                if not uses_index:
+                    failures.append(label)
+        if failures and options['check']:
+            raise CommandError("Queries not using their index: %s" % ', '.join(failures))
@@ -6,6 +6,8 @@ from django.conf import settings
 from django.contrib.auth.models import BaseUserManager
 from django.core import signing
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 
@@ -45,6 +47,20 @@ class UserManager(BaseUserManager):
                                      **extra_fields)
         return instance
 
+    def active_by_identifier(self, identifier):
+        """
+        Returns the active users whose email, username or mobile matches `identifier` case-insensitively.
+        The lookups compare against `LOWER(<column>)` so that the functional indexes on User are used,
+        and all three are answered in a single query.
+        """
+        identifier = identifier.lower()
+        return self.alias(
+            email_lower=Lower('email'), username_lower=Lower('username'), mobile_lower=Lower('mobile')
+        ).filter(
+            Q(email_lower=identifier) | Q(username_lower=identifier) | Q(mobile_lower=identifier),
+            is_active=True
+        ).order_by('pk')
+
 
 class PasswordResetCodeManager(models.Manager):
 
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.4 on 2026-10-18 10:00
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                django.db.models.functions.text.Lower("email"),
+                name="user_email_lower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                django.db.models.functions.text.Lower("username"),
+                name="user_username_lower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                django.db.models.functions.text.Lower("mobile"),
+                name="user_mobile_lower_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0002_user_identifier_lower_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="token_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
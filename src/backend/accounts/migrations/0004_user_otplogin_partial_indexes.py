@@ -0,0 +1,29 @@
+# Generated by Django 4.2.4 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0003_user_token_version"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["mobile"],
+                name="user_active_mobile_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="otplogin",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["mobile", "modified_at"],
+                name="otplogin_active_mobile_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 4.2.4 on 2026-10-18 13:00
+
+import re
+import unicodedata
+
+from django.db import migrations, models, transaction
+
+# Frozen copy of `accounts.search.build_search_text` as of this migration
+SEARCH_FIELDS = ("first_name", "middle_name", "last_name", "email", "mobile")
+
+
+def build_search_text(user):
+    value = " ".join(getattr(user, name) or "" for name in SEARCH_FIELDS)
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return re.sub(r"\s+", " ", value).strip().lower()
+
+
+def backfill_search_text(apps, schema_editor):
+    User = apps.get_model("accounts", "User")
+    batch = []
+    for user in User.objects.using(schema_editor.connection.alias).only(
+            "id", "first_name", "middle_name", "last_name", "email", "mobile").iterator(chunk_size=2000):
+        user.search_text = build_search_text(user)
+        batch.append(user)
+        if len(batch) >= 2000:
+            User.objects.bulk_update(batch, ["search_text"])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ["search_text"])
+
+
+def create_trigram_index(apps, schema_editor):
+    # GIN trigram index for LIKE '%...%' on search_text; skipped where pg_trgm can't be installed
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except Exception:
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS user_search_text_trgm_idx ON accounts_user USING gin (search_text gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS user_search_text_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0004_user_otplogin_partial_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="search_text",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.RunPython(backfill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
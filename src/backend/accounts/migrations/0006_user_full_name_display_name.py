@@ -0,0 +1,48 @@
+# Generated by Django 4.2.4 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+# Frozen copies of `base.utils.short_data.join_name` / `get_display_name` as of this migration
+def join_name(first_name, middle_name, last_name):
+    return " ".join(part for part in (first_name, middle_name, last_name) if part)
+
+
+def get_display_name(full_name, email, username, mobile):
+    return full_name or email or username or mobile or ""
+
+
+def backfill_names(apps, schema_editor):
+    User = apps.get_model("accounts", "User")
+    batch = []
+    for user in User.objects.using(schema_editor.connection.alias).only(
+            "id", "first_name", "middle_name", "last_name", "email", "username", "mobile").iterator(chunk_size=2000):
+        user.full_name = join_name(user.first_name, user.middle_name, user.last_name)
+        user.display_name = get_display_name(user.full_name, user.email, user.username, user.mobile)
+        batch.append(user)
+        if len(batch) >= 2000:
+            User.objects.bulk_update(batch, ["full_name", "display_name"])
+            batch = []
+    if batch:
+        User.objects.bulk_update(batch, ["full_name", "display_name"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0005_user_search_text"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="full_name",
+            field=models.CharField(blank=True, default="", editable=False, max_length=400),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="display_name",
+            field=models.CharField(blank=True, default="", editable=False, max_length=400),
+        ),
+        migrations.RunPython(backfill_names, migrations.RunPython.noop),
+    ]
@@ -4,18 +4,22 @@ from __future__ import unicode_literals
 import logging
 
 from django.conf import settings
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import AbstractBaseUser, \
     PermissionsMixin
 # Sending Email
 from django.core.mail import EmailMultiAlternatives
 from django.db import models
+from django.db.models.functions import Lower
 from django.template.loader import render_to_string
 from django.utils.translation import gettext_lazy as _
 
 from .managers import PasswordResetCodeManager, UserManager
+from .search import SEARCH_FIELDS, build_search_text
 from ..base.api.constants import CUSTOMER_ROLE_SEED_DATA
 from ..base.models import TimeStampedModel
 from ..base.utils import short_data
+from ..base.utils.email import enqueue
 
 logger = logging.getLogger(__name__)
 
@@ -38,13 +42,36 @@ class User(AbstractBaseUser, PermissionsMixin, TimeStampedModel):
     is_staff = models.BooleanField(default=False)
     is_separated = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    # Bumped whenever the password or a field copied into token claims changes, see `TOKEN_STATE_FIELDS`
+    token_version = models.PositiveIntegerField(default=0, editable=False)
+    # Normalized `search.SEARCH_FIELDS`, kept up to date by save(); trigram indexed on PostgreSQL
+    search_text = models.TextField(blank=True, default='', editable=False)
+    # Precomputed for listings and exports, kept up to date by save() (see `DERIVED_FIELDS`)
+    full_name = models.CharField(max_length=400, blank=True, default='', editable=False)
+    display_name = models.CharField(max_length=400, blank=True, default='', editable=False)
     objects = UserManager()
+    # Fields copied into the JWT claims, changing one of them invalidates issued tokens
+    TOKEN_STATE_FIELDS = ('is_active', 'is_separated', 'is_superuser')
+    # Columns computed by `update_derived_fields`, with the fields they are computed from
+    DERIVED_FIELDS = {
+        'search_text': SEARCH_FIELDS,
+        'full_name': ('first_name', 'middle_name', 'last_name'),
+        'display_name': ('first_name', 'middle_name', 'last_name', 'email', 'username', 'mobile'),
+    }
     # Email address to be used as the username
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['mobile', 'first_name']
 
     class Meta:
         verbose_name_plural = 'Users'
+        indexes = [
+            # Used by the case-insensitive login / password-reset lookups
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+            models.Index(Lower('username'), name='user_username_lower_idx'),
+            models.Index(Lower('mobile'), name='user_mobile_lower_idx'),
+            # OTP login looks active users up by mobile
+            models.Index(fields=['mobile'], condition=models.Q(is_active=True), name='user_active_mobile_idx'),
+        ]
 
     def __str__(self):
         """Returns the email of the User when it is printed in the console"""
@@ -58,12 +85,57 @@ class User(AbstractBaseUser, PermissionsMixin, TimeStampedModel):
         """
         Returns the first_name plus the last_name, with a space in between.
         """
-        full_name = self.first_name
-        if self.middle_name:
-            full_name += " " + self.middle_name
-        if self.last_name:
-            full_name += " " + self.last_name
-        return full_name or ''
+        return short_data.join_name(self.first_name, self.middle_name, self.last_name)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(User, cls).from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if all(name in loaded for name in cls.TOKEN_STATE_FIELDS):
+            instance._token_state = tuple(loaded[name] for name in cls.TOKEN_STATE_FIELDS)
+        instance._saved_search_text = loaded.get('search_text')
+        return instance
+
+    def get_token_state(self):
+        return tuple(getattr(self, name) for name in self.TOKEN_STATE_FIELDS)
+
+    def set_password(self, raw_password):
+        super(User, self).set_password(raw_password)
+        self._token_version_changed = True
+
+    def check_password(self, raw_password):
+        # Same as AbstractBaseUser.check_password, but a hasher upgrade isn't a password change
+        def setter(raw_password):
+            AbstractBaseUser.set_password(self, raw_password)
+            self._password = None
+            self.save(update_fields=["password"])
+        return check_password(raw_password, self.password, setter)
+
+    def update_derived_fields(self):
+        self.search_text = build_search_text(self)
+        self.full_name = short_data.join_name(self.first_name, self.middle_name, self.last_name)
+        self.display_name = short_data.get_display_name(self.full_name, self.email, self.username, self.mobile)
+
+    def save(self, *args, **kwargs):
+        token_state = getattr(self, '_token_state', None)
+        if getattr(self, '_token_version_changed', False) or \
+                (token_state is not None and token_state != self.get_token_state()):
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'token_version'}
+        self.update_derived_fields()
+        if kwargs.get('update_fields') is not None:
+            update_fields = set(kwargs['update_fields'])
+            kwargs['update_fields'] = update_fields | {
+                name for name, sources in self.DERIVED_FIELDS.items() if update_fields.intersection(sources)
+            }
+        # Read by the post_save signal, so saves like `last_login` keep the search index
+        self._search_text_changed = self.search_text != getattr(self, '_saved_search_text', None) and (
+            kwargs.get('update_fields') is None or 'search_text' in kwargs['update_fields'])
+        super(User, self).save(*args, **kwargs)
+        self._token_version_changed = False
+        self._token_state = self.get_token_state()
+        self._saved_search_text = self.search_text
 
 
 class AbstractBaseCode(TimeStampedModel):
@@ -105,8 +177,7 @@ class AbstractBaseCode(TimeStampedModel):
         try:
             msg = EmailMultiAlternatives(subject, text_content, from_email, [to])
             msg.attach_alternative(html_content, 'text/html')
-            msg.send()
-            print("Email Sent succesfully")
+            return enqueue(msg)
         except Exception:
             logger.exception("Unable to send the mail.")
 
@@ -129,3 +200,10 @@ class OTPLogin(TimeStampedModel):
     counter = models.IntegerField(blank=True, default=25)
     is_active = models.BooleanField(default=True)
     resend_counter = models.IntegerField(blank=True, default=25)
+
+    class Meta:
+        indexes = [
+            # DatabaseOTPStore filters active rows by mobile and modified_at (and otp, which is checked on the few rows left)
+            models.Index(fields=['mobile', 'modified_at'], condition=models.Q(is_active=True),
+                         name='otplogin_active_mobile_idx'),
+        ]
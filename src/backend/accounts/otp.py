@@ -0,0 +1,129 @@
+import secrets
+import string
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import OTPLogin
+from ..base.cache import Namespace
+
+
+def generate_otp(length=6):
+    return ''.join(secrets.choice(string.digits) for _ in range(length))
+
+
+class BaseOTPStore(object):
+    """
+    Storage for login OTPs, selected with `settings.OTP_STORE`.
+
+    - at most `OTP_DAILY_LIMIT` OTPs are issued per mobile and day
+    - an OTP can be resent `OTP_RESEND_LIMIT` times and is valid for `OTP_VALIDITY_MINUTES`
+      after it was last sent
+    - an OTP can be verified once
+    """
+
+    def __init__(self):
+        self.daily_limit = settings.OTP_DAILY_LIMIT
+        self.resend_limit = settings.OTP_RESEND_LIMIT
+        self.validity = timedelta(minutes=settings.OTP_VALIDITY_MINUTES)
+
+    def issue(self, mobile, otp):
+        """Stores a new `otp` for `mobile`, returns False when the daily limit is reached."""
+        raise NotImplementedError
+
+    def resend(self, mobile):
+        """Returns the current OTP of `mobile` and uses up one resend, None if there is nothing to resend."""
+        raise NotImplementedError
+
+    def verify(self, mobile, otp):
+        """Returns True and consumes the OTP when `otp` is the valid OTP of `mobile`."""
+        raise NotImplementedError
+
+
+class DatabaseOTPStore(BaseOTPStore):
+    """OTPs kept in the `OTPLogin` table."""
+
+    def issue(self, mobile, otp):
+        OTPLogin.objects.filter(mobile=mobile, modified_at__lt=date.today(), is_active=True).delete()
+        login_obj = OTPLogin.objects.filter(mobile=mobile, is_active=True, modified_at__gte=date.today()).first()
+        if login_obj is None:
+            OTPLogin.objects.create(mobile=mobile, otp=otp, counter=self.daily_limit,
+                                    resend_counter=self.resend_limit)
+            return True
+        counter = login_obj.counter - 1
+        if counter <= 0:
+            return False
+        OTPLogin.objects.filter(mobile=mobile, is_active=True, modified_at__gte=date.today()).update(
+            otp=otp, is_active=True, counter=counter, resend_counter=self.resend_limit, modified_at=datetime.now())
+        return True
+
+    def resend(self, mobile):
+        login_obj = OTPLogin.objects.filter(mobile=mobile, is_active=True, modified_at__gte=datetime.now() - self.validity,
+                                            resend_counter__gt=0).first()
+        if login_obj is None:
+            return None
+        login_obj.resend_counter = login_obj.resend_counter - 1
+        login_obj.save()
+        return login_obj.otp
+
+    def verify(self, mobile, otp):
+        login_obj = OTPLogin.objects.filter(mobile=mobile, otp=otp, is_active=True,
+                                            modified_at__gte=datetime.now() - self.validity).first()
+        if login_obj is None:
+            return False
+        login_obj.is_active = False
+        login_obj.save()
+        return True
+
+
+class CacheOTPStore(BaseOTPStore):
+    """
+    OTPs kept in the cache with TTL expiry and counters updated with `incr`.
+    Needs a cache shared by all processes (see `CACHES`), the local memory default isn't.
+    """
+
+    def __init__(self):
+        super(CacheOTPStore, self).__init__()
+        self.cache = Namespace('otp', timeout=int(self.validity.total_seconds()))
+
+    def issue(self, mobile, otp):
+        daily_key = 'daily:%s:%s' % (mobile, date.today().isoformat())
+        if not self.cache.add(daily_key, 1, 24 * 60 * 60):
+            try:
+                if self.cache.incr(daily_key) > self.daily_limit:
+                    return False
+            except ValueError:
+                # Expired between add() and incr()
+                self.cache.add(daily_key, 1, 24 * 60 * 60)
+        self.cache.set_many({'code:%s' % mobile: str(otp), 'resends:%s' % mobile: 0})
+        return True
+
+    def resend(self, mobile):
+        otp = self.cache.get('code:%s' % mobile)
+        if otp is None:
+            return None
+        try:
+            if self.cache.incr('resends:%s' % mobile) > self.resend_limit:
+                return None
+        except ValueError:
+            return None
+        # Like the table store, a resend restarts the validity window
+        self.cache.touch('code:%s' % mobile)
+        self.cache.touch('resends:%s' % mobile)
+        return otp
+
+    def verify(self, mobile, otp):
+        if otp is None or self.cache.get('code:%s' % mobile) != str(otp):
+            return False
+        # Only the request that deletes the key gets to use it
+        return self.cache.delete('code:%s' % mobile)
+
+
+_stores = {}
+
+
+def get_otp_store():
+    if settings.OTP_STORE not in _stores:
+        _stores[settings.OTP_STORE] = import_string(settings.OTP_STORE)()
+    return _stores[settings.OTP_STORE]
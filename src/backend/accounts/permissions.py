@@ -35,3 +35,4 @@ class UserPermissions(ResourcePermission):
     verify_otp_perms = AllowAny()
     admin_list_perms = IsSuperUser()
     update_profile_perms = IsSuperUser()
+    autocomplete_perms = IsSuperUser()
@@ -0,0 +1,131 @@
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import Case, IntegerField, Value, When
+
+# User fields copied into `User.search_text`
+SEARCH_FIELDS = ('first_name', 'middle_name', 'last_name', 'email', 'mobile')
+
+
+def normalize(value):
+    """Lowercase, accents stripped, whitespace collapsed."""
+    value = unicodedata.normalize('NFKD', str(value or ''))
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return re.sub(r'\s+', ' ', value).strip().lower()
+
+
+def build_search_text(user):
+    return normalize(' '.join(getattr(user, name) or '' for name in SEARCH_FIELDS))
+
+
+def trigrams(value):
+    """Trigrams of each word padded like pg_trgm does, so both backends rank alike."""
+    grams = set()
+    for word in value.split():
+        word = '  %s ' % word
+        grams.update(word[index:index + 3] for index in range(len(word) - 2))
+    return grams
+
+
+class NgramIndex(object):
+    """
+    In-process trigram index of `User.search_text`, only used to rank matches on SQLite (tests and
+    local runs). Built on first use and dropped by the User save/delete signals of this process.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(set)
+        self.texts = {}
+        self.grams = {}
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        for pk, text in get_user_model().objects.values_list('pk', 'search_text').iterator():
+            index.add(pk, text)
+        return index
+
+    def add(self, pk, text):
+        self.texts[pk] = text
+        self.grams[pk] = trigrams(text)
+        for gram in self.grams[pk]:
+            self.postings[gram].add(pk)
+
+    def search(self, value):
+        """Primary keys whose text contains `value`, best trigram similarity first."""
+        query_grams = trigrams(value)
+        # Only grams inside words are required, the padded edge grams may not match a substring
+        required = [self.postings.get(gram, set()) for gram in query_grams if not gram.startswith(' ')
+                    and not gram.endswith(' ')]
+        candidates = set.intersection(*sorted(required, key=len)) if required else self.texts.keys()
+        matches = [pk for pk in candidates if value in self.texts[pk]]
+        return sorted(matches, key=lambda pk: (-self.similarity(query_grams, self.grams[pk]), pk))
+
+    @staticmethod
+    def similarity(query_grams, grams):
+        if not query_grams:
+            return 0
+        return len(query_grams & grams) / float(len(query_grams | grams))
+
+
+_index = None
+_index_lock = threading.Lock()
+_trigram_support = {}
+
+
+def get_ngram_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NgramIndex.build()
+        return _index
+
+
+def clear_ngram_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def has_trigram_support(alias):
+    if alias not in _trigram_support:
+        connection = connections[alias]
+        supported = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                supported = cursor.fetchone() is not None
+        _trigram_support[alias] = supported
+    return _trigram_support[alias]
+
+
+def search_users(queryset, value):
+    """
+    Users of `queryset` whose name, email or mobile contains `value`, most similar first.
+
+    Matches are always found in SQL with a `LIKE` on `search_text`. On PostgreSQL with pg_trgm it is
+    answered by its GIN trigram index and ranked with `word_similarity`; on SQLite the first
+    `USER_SEARCH_RANK_LIMIT` matches of the in-process `NgramIndex` are ranked, then the rest by pk.
+    Other databases aren't ranked.
+    """
+    value = normalize(value)
+    if not value:
+        return queryset
+    queryset = queryset.filter(search_text__contains=value)
+    if has_trigram_support(queryset.db):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        return queryset.annotate(
+            similarity=TrigramWordSimilarity(value, 'search_text')
+        ).order_by('-similarity', 'pk')
+    if connections[queryset.db].vendor != 'sqlite':
+        return queryset.order_by('pk')
+
+    pks = get_ngram_index().search(value)[:settings.USER_SEARCH_RANK_LIMIT]
+    rank = Case(*[When(pk=pk, then=Value(position)) for position, pk in enumerate(pks)],
+                default=Value(len(pks)), output_field=IntegerField())
+    return queryset.annotate(search_rank=rank).order_by('search_rank', 'pk')
@@ -15,7 +15,8 @@ class UserSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = (
-            'id', 'email', 'mobile', "password", 'first_name', 'middle_name', 'last_name', 'username', 'is_superuser'
+            'id', 'email', 'mobile', "password", 'first_name', 'middle_name', 'last_name', 'username', 'is_superuser',
+            'full_name', 'display_name'
         )
         extra_kwargs = {'password': {'write_only': True}, 'last_login': {'read_only': True},
                         'is_superuser': {'read_only': True}}
@@ -25,7 +26,8 @@ class UserBasicDataSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = (
-            'id', 'first_name', 'middle_name', 'last_name', 'email', 'username', 'mobile', 'dob', 'is_active'
+            'id', 'first_name', 'middle_name', 'last_name', 'email', 'username', 'mobile', 'dob', 'is_active',
+            'full_name', 'display_name'
         )
 
 
@@ -110,7 +112,8 @@ class UserRegisterSerializer(ModelSerializer):
     class Meta:
         model = get_user_model()
         fields = (
-            'id', 'email', 'mobile', "password", 'first_name', 'middle_name', 'last_name', 'username'
+            'id', 'email', 'mobile', "password", 'first_name', 'middle_name', 'last_name', 'username',
+            'full_name', 'display_name'
         )
         extra_kwargs = {'password': {'write_only': True}}
         read_only_fields = ('id',)
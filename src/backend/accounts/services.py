@@ -5,13 +5,16 @@ from decouple import config
 from functools import partial
 from collections import namedtuple
 from django.contrib.auth import get_user_model
-from django.contrib.auth import login
+from django.conf import settings
+from django.contrib.auth import login, user_logged_in
 from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from .serializers import LoginSerializer, UserSerializer, PasswordChangeSerializer, \
     UserRegistrationSerializer
 
+from .authentication import TOKEN_VERSION_CLAIM, user_cache
+
 from ..base import response
 
 User = namedtuple('User', ['email', 'password'])
@@ -134,22 +137,27 @@ def auth_register_user(request):
 
 
 def get_user_from_email_or_mobile_or_employee_code(username):
-    user_model = get_user_model()
-    mobile_user = user_model.objects.filter(mobile__iexact=username, is_active=True).first()
-    email_user = user_model.objects.filter(email__iexact=username, is_active=True).first()
-    username_user = user_model.objects.filter(username__iexact=username, is_active=True).first()
-    if email_user:
-        user = email_user
-    elif username_user:
-        user = username_user
-    else:
-        user = mobile_user
+    """
+    Resolves the active user for a login identifier in a single query.
+    Precedence is email, then username, then mobile.
+    return: user, email_user, username_user, mobile_user
+    """
+    email_user = username_user = mobile_user = None
+    identifier = username.lower()
+    for candidate in get_user_model().objects.active_by_identifier(username):
+        if email_user is None and candidate.email and candidate.email.lower() == identifier:
+            email_user = candidate
+        if username_user is None and candidate.username and candidate.username.lower() == identifier:
+            username_user = candidate
+        if mobile_user is None and candidate.mobile and candidate.mobile.lower() == identifier:
+            mobile_user = candidate
+    user = email_user or username_user or mobile_user
     return user, email_user, username_user, mobile_user
 
 
 def generate_auth_data(request, user):
     token = get_tokens_for_user(user)
-    login(request, user)
+    login_user(request, user)
     auth_data = {
         "refresh": token.get('refresh'),
         "access": token.get('access'),
@@ -158,8 +166,24 @@ def generate_auth_data(request, user):
     return auth_data
 
 
+def login_user(request, user):
+    """
+    With `AUTH_LOGIN_MODE = 'stateless'` the bearer tokens are the only credentials,
+    so no session is created; `user_logged_in` is still sent.
+    """
+    if settings.AUTH_LOGIN_MODE == 'session':
+        login(request, user)
+        return
+    request.user = user
+    user_logged_in.send(sender=user.__class__, request=request, user=user)
+
+
 def get_tokens_for_user(user):
     refresh = RefreshToken.for_user(user)
+    # Claims read by TokenUserAuthentication, copied into the access token
+    for name in user.TOKEN_STATE_FIELDS:
+        refresh[name] = getattr(user, name)
+    refresh[TOKEN_VERSION_CLAIM] = user.token_version
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
@@ -168,7 +192,7 @@ def get_tokens_for_user(user):
 
 def user_clone_api(user, is_admin=False, permissions=[]):
     auth_data = {
-        "user": UserSerializer(instance=user).data,
+        "user": user_cache.get_or_set('clone:%s' % user.pk, lambda: dict(UserSerializer(instance=user).data)),
         "is_admin": is_admin,
         "permissions": permissions,
     }
@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import user_cache
+from .directory import user_directory
+from .search import clear_ngram_index
+
+
+@receiver(post_save, sender=get_user_model(), dispatch_uid='accounts.invalidate_user_cache.save')
+@receiver(post_delete, sender=get_user_model(), dispatch_uid='accounts.invalidate_user_cache.delete')
+def invalidate_user_cache(sender, instance, **kwargs):
+    # Covers password changes and deactivation, which are saved through the model.
+    # Queryset .update() calls on users bypass this and must call user_cache.delete themselves.
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    user_cache.delete(user_id)
+    user_cache.delete('clone:%s' % user_id)
+    user_cache.delete('version:%s' % user_id)
+
+
+@receiver(post_save, sender=get_user_model(), dispatch_uid='accounts.clear_search_index.save')
+@receiver(post_delete, sender=get_user_model(), dispatch_uid='accounts.clear_search_index.delete')
+def clear_search_index(sender, instance, **kwargs):
+    if kwargs.get('signal') is post_delete or getattr(instance, '_search_text_changed', True):
+        clear_ngram_index()
+
+
+@receiver(post_save, sender=get_user_model(), dispatch_uid='accounts.update_user_directory.save')
+def update_user_directory(sender, instance, **kwargs):
+    user_directory.update(instance)
+
+
+@receiver(post_delete, sender=get_user_model(), dispatch_uid='accounts.update_user_directory.delete')
+def remove_from_user_directory(sender, instance, **kwargs):
+    user_directory.update(instance, deleted=True)
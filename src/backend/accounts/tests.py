@@ -1,3 +1,711 @@
-from django.test import TestCase
+import importlib
+import json
+import re
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth import get_user_model, hashers
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from .authentication import CachedJWTAuthentication, ClaimsUser, TokenUserAuthentication
+from .management.commands import explain_hot_queries
+from .models import OTPLogin
+from . import directory, search
+from .otp import generate_otp, get_otp_store
+from .serializers import UserRegisterSerializer, UserSerializer
+from .services import get_tokens_for_user, get_user_from_email_or_mobile_or_employee_code
+from ..base.api.pagination import EstimatedCountPaginator
+from ..base.api.renderers import FastJSONRenderer
+from ..base.serializers import compile_fast_plan, get_fast_plan
+from ..base.models import SMSOutbox
+from ..base.utils import short_data
+
+DATABASE_OTP_STORE = 'backend.accounts.otp.DatabaseOTPStore'
+CACHE_OTP_STORE = 'backend.accounts.otp.CacheOTPStore'
+
+
+def create_user(email='user@example.com', mobile='9000000001', password='secret123', **extra_fields):
+    return get_user_model().objects.create_user('Test', 'User', mobile, email, password, is_active=True,
+                                                **extra_fields)
+
+
+class OTPStoreTests(object):
+    """Checks shared by every OTP store, mixed into one TestCase per store."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = create_user()
+        self.store = get_otp_store()
+
+    def post(self, action, data):
+        return self.client.post('/fh-api/v1/users/%s/' % action, data, format='json')
+
+    def test_generate_otp(self):
+        otp = generate_otp(6)
+        self.assertEqual(len(otp), 6)
+        self.assertTrue(otp.isdigit())
+
+    def test_issue_resend_verify(self):
+        self.assertTrue(self.store.issue('9000000001', '123456'))
+        self.assertEqual(self.store.resend('9000000001'), '123456')
+        self.assertFalse(self.store.verify('9000000001', '654321'))
+        self.assertTrue(self.store.verify('9000000001', '123456'))
+        # An OTP is consumed by its first successful verification
+        self.assertFalse(self.store.verify('9000000001', '123456'))
+
+    def test_resend_limit(self):
+        self.store.issue('9000000001', '123456')
+        self.assertEqual(self.store.resend('9000000001'), '123456')
+        self.assertEqual(self.store.resend('9000000001'), '123456')
+        self.assertIsNone(self.store.resend('9000000001'))
+
+    def test_resend_without_otp(self):
+        self.assertIsNone(self.store.resend('9000000002'))
+
+    def test_daily_limit(self):
+        results = [self.store.issue('9000000001', '12345%s' % number) for number in range(4)]
+        self.assertEqual(results.count(False), 1)
+        self.assertFalse(results[-1])
+
+    def test_send_resend_verify_endpoints(self):
+        res = self.post('send_otp', {'mobile': '9000000001'})
+        self.assertEqual(res.status_code, 200, res.content)
+        otp = re.search(r'\d{6}', SMSOutbox.objects.get(mobile='9000000001').body).group()
+
+        res = self.post('resend_otp', {'mobile': '9000000001'})
+        self.assertEqual(res.status_code, 200, res.content)
+        self.assertEqual(SMSOutbox.objects.filter(mobile='9000000001', body__contains=otp).count(), 2)
+
+        res = self.post('verify_otp', {'mobile': '9000000001', 'otp': '000000' if otp != '000000' else '111111'})
+        self.assertEqual(res.status_code, 400)
+        res = self.post('verify_otp', {'mobile': '9000000001', 'otp': otp})
+        self.assertEqual(res.status_code, 200, res.content)
+        self.assertIn('access', str(res.content))
+
+    def test_send_otp_unknown_mobile(self):
+        res = self.post('send_otp', {'mobile': '9999999999'})
+        self.assertEqual(res.status_code, 400)
+
+
+@override_settings(OTP_STORE=DATABASE_OTP_STORE, OTP_RESEND_LIMIT=2, OTP_DAILY_LIMIT=3, RATE_LIMIT_ENABLED=False)
+class DatabaseOTPStoreTests(OTPStoreTests, TestCase):
+
+    def test_rows_are_stored(self):
+        self.store.issue('9000000001', '123456')
+        self.assertTrue(OTPLogin.objects.filter(mobile='9000000001', otp='123456', is_active=True).exists())
+
+
+@override_settings(OTP_STORE=CACHE_OTP_STORE, OTP_RESEND_LIMIT=2, OTP_DAILY_LIMIT=3, RATE_LIMIT_ENABLED=False)
+class CacheOTPStoreTests(OTPStoreTests, TestCase):
+
+    def test_no_rows_are_stored(self):
+        self.store.issue('9000000001', '123456')
+        self.assertFalse(OTPLogin.objects.exists())
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class UserListingPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(3):
+            create_user(email='user%s@example.com' % number, mobile='900000000%s' % number)
+
+    def setUp(self):
+        # Counts are cached by query
+        cache.clear()
+
+    def test_plain_list_by_default(self):
+        for url in ('/fh-api/v1/users/', '/fh-api/v1/users/register/'):
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, 200)
+            # Rendered through the DRF renderers, not streamed
+            self.assertFalse(res.streaming)
+            data = res.json()
+            self.assertIsInstance(data, list)
+            self.assertEqual(len(data), 3)
+
+    def test_streamed_when_pagination_is_off(self):
+        for url in ('/fh-api/v1/users/', '/fh-api/v1/users/register/'):
+            res = self.client.get(url, {'pagination': 'false'})
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(res.streaming)
+            self.assertEqual(len(json.loads(b''.join(res.streaming_content))), 3)
+
+    def test_paginated_when_requested(self):
+        res = self.client.get('/fh-api/v1/users/', {'page_size': 2})
+        self.assertEqual(res.status_code, 200)
+        data = res.json()
+        self.assertEqual(data['count'], 3)
+        self.assertFalse(data['count_is_estimate'])
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual(data['next'], 2)
+
+        res = self.client.get('/fh-api/v1/users/register/', {'page': 1})
+        self.assertEqual(res.json()['count'], 3)
+
+    def test_estimated_count_is_flagged(self):
+        with mock.patch.object(EstimatedCountPaginator, 'estimate_count', return_value=50000):
+            res = self.client.get('/fh-api/v1/users/', {'page': 1, 'count': 'estimate'})
+            data = res.json()
+            self.assertEqual(data['count'], 50000)
+            self.assertTrue(data['count_is_estimate'])
+
+            res = self.client.get('/fh-api/v1/users/', {'page': 1, 'count': 'exact'})
+            data = res.json()
+            self.assertEqual(data['count'], 3)
+            self.assertFalse(data['count_is_estimate'])
+
+
+class SearchIndexTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.user = get_user_model().objects.get(pk=self.user.pk)
+        self.index = search.get_ngram_index()
+
+    def test_unrelated_saves_keep_the_index(self):
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.assertIs(search.get_ngram_index(), self.index)
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertIs(search.get_ngram_index(), self.index)
+
+    def test_search_text_changes_clear_the_index(self):
+        self.user.first_name = 'Renamed'
+        self.user.save(update_fields=['first_name'])
+        index = search.get_ngram_index()
+        self.assertIsNot(index, self.index)
+        self.assertEqual(index.search('renamed'), [self.user.pk])
+
+    def test_new_and_deleted_users_clear_the_index(self):
+        other = create_user(email='other@example.com', mobile='9000000002')
+        self.assertIsNot(search.get_ngram_index(), self.index)
+        index = search.get_ngram_index()
+        other.delete()
+        self.assertIsNot(search.get_ngram_index(), index)
+
+
+class SearchUsersTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [create_user(email='anand%s@example.com' % number, mobile='900000000%s' % number)
+                     for number in range(3)]
+
+    def search(self, value):
+        return list(search.search_users(get_user_model().objects.all(), value).values_list('pk', flat=True))
+
+    def test_matches_come_from_the_database(self):
+        self.assertEqual(len(self.search('anand')), 3)
+        search.get_ngram_index()
+        # Saved by another process, whose signals don't reach this one's index
+        get_user_model().objects.filter(pk=self.users[0].pk).update(search_text='someone else')
+        self.assertEqual(sorted(self.search('anand')), [user.pk for user in self.users[1:]])
+        self.assertEqual(self.search('someone'), [self.users[0].pk])
+
+    def test_closest_first(self):
+        self.assertEqual(self.search('anand2@example.com')[0], self.users[2].pk)
+
+    @override_settings(USER_SEARCH_RANK_LIMIT=1)
+    def test_ranked_matches_are_capped(self):
+        closest = create_user(email='anand@x.io', mobile='1')
+        # Only the best match is ranked, the other matches still follow by pk
+        self.assertEqual(self.search('anand'), [closest.pk] + [user.pk for user in self.users])
+
+    def test_other_databases_skip_the_index(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(search, 'has_trigram_support', return_value=False), \
+                mock.patch.object(search, 'get_ngram_index') as get_ngram_index:
+            self.assertEqual(self.search('anand'), [user.pk for user in self.users])
+        get_ngram_index.assert_not_called()
+
+
+class IdentifierLookupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Created in reverse precedence, so the lowest pk isn't the expected match
+        cls.mobile_user = create_user(email='mobile@example.com', mobile='Shared@Example.com')
+        cls.username_user = create_user(email='username@example.com', mobile='9000000002',
+                                        username='shared@example.com')
+        cls.email_user = create_user(email='shared@example.com', mobile='9000000003')
+        create_user(email='inactive@example.com', mobile='9000000009', username='inactive')
+        get_user_model().objects.filter(email='inactive@example.com').update(is_active=False)
+
+    def test_precedence_in_one_query(self):
+        with self.assertNumQueries(1):
+            user, email_user, username_user, mobile_user = \
+                get_user_from_email_or_mobile_or_employee_code('SHARED@example.com')
+        self.assertEqual(user, self.email_user)
+        self.assertEqual(email_user, self.email_user)
+        self.assertEqual(username_user, self.username_user)
+        self.assertEqual(mobile_user, self.mobile_user)
+
+    def test_username_before_mobile(self):
+        self.email_user.delete()
+        user, email_user, username_user, mobile_user = get_user_from_email_or_mobile_or_employee_code(
+            'shared@example.com')
+        self.assertIsNone(email_user)
+        self.assertEqual(user, self.username_user)
+
+        self.username_user.delete()
+        self.assertEqual(get_user_from_email_or_mobile_or_employee_code('shared@example.com')[0], self.mobile_user)
+
+    def test_inactive_and_unknown_users(self):
+        self.assertEqual(get_user_from_email_or_mobile_or_employee_code('inactive'), (None, None, None, None))
+        self.assertEqual(get_user_from_email_or_mobile_or_employee_code('nobody'), (None, None, None, None))
+
+
+class TokenVersionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.authentication = TokenUserAuthentication()
+
+    def authenticate(self, tokens):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Bearer %s' % tokens['access'])
+        return self.authentication.authenticate(request)
+
+    def test_valid_token(self):
+        user, token = self.authenticate(get_tokens_for_user(self.user))
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual(user.id, self.user.pk)
+        self.assertTrue(user.is_active)
+        self.assertFalse(user.is_superuser)
+
+    def test_password_change_invalidates_tokens(self):
+        tokens = get_tokens_for_user(self.user)
+        self.authenticate(tokens)
+        self.user.set_password('changed123')
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(tokens)
+        self.assertIsNotNone(self.authenticate(get_tokens_for_user(self.user)))
+
+    def test_claim_changes_invalidate_tokens(self):
+        tokens = get_tokens_for_user(self.user)
+        self.user.is_superuser = True
+        self.user.save(update_fields=['is_superuser'])
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(tokens)
+        user, token = self.authenticate(get_tokens_for_user(self.user))
+        self.assertTrue(user.is_superuser)
+
+    def test_unrelated_saves_keep_tokens(self):
+        tokens = get_tokens_for_user(self.user)
+        self.user.first_name = 'Renamed'
+        self.user.last_login = timezone.now()
+        self.user.save()
+        self.assertIsNotNone(self.authenticate(tokens))
+
+    def test_deactivation_invalidates_tokens(self):
+        tokens = get_tokens_for_user(self.user)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(tokens)
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [create_user(email='user%s@example.com' % number, mobile='90000000%02d' % number)
+                     for number in range(5)]
+
+    def get(self, cursor='', **params):
+        res = self.client.get('/fh-api/v1/users/', dict(params, cursor=cursor))
+        self.assertEqual(res.status_code, 200, res.content)
+        return res.json()
+
+    def ids(self, data):
+        return [item['id'] for item in data['results']]
+
+    def test_next_and_previous(self):
+        newest_first = [user.pk for user in reversed(self.users)]
+        first = self.get(page_size=2)
+        self.assertEqual(self.ids(first), newest_first[:2])
+        self.assertIsNone(first['previous'])
+
+        second = self.get(first['next'], page_size=2)
+        self.assertEqual(self.ids(second), newest_first[2:4])
+        third = self.get(second['next'], page_size=2)
+        self.assertEqual(self.ids(third), newest_first[4:])
+        self.assertIsNone(third['next'])
+
+        back = self.get(third['previous'], page_size=2)
+        self.assertEqual(self.ids(back), newest_first[2:4])
+        back = self.get(back['previous'], page_size=2)
+        self.assertEqual(self.ids(back), newest_first[:2])
+        self.assertIsNone(back['previous'])
+        self.assertEqual(self.ids(self.get(back['next'], page_size=2)), newest_first[2:4])
+
+    def test_invalid_cursor(self):
+        res = self.client.get('/fh-api/v1/users/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(res.status_code, 404)
+
+
+class UpperCaseField(serializers.CharField):
+
+    def to_representation(self, value):
+        return super(UpperCaseField, self).to_representation(value).upper()
+
+
+class UpperCaseUserSerializer(UserSerializer):
+    first_name = UpperCaseField()
+
+
+class FastPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_user(email='user0@example.com', mobile='9000000000', username='user0')
+        create_user(email='user1@example.com', mobile='9000000001', middle_name=None)
+        create_user(email='user2@example.com', mobile='9000000002')
+        get_user_model().objects.filter(email='user2@example.com').update(is_superuser=True)
+
+    def test_output_matches_serializer(self):
+        renderer = FastJSONRenderer()
+        for serializer_class in (UserSerializer, UserRegisterSerializer):
+            queryset = get_user_model().objects.order_by('pk')
+            plan = get_fast_plan(serializer_class)
+            self.assertIsNotNone(plan, serializer_class)
+            self.assertEqual(renderer.render(plan.to_representations(plan.project(queryset))),
+                             renderer.render(serializer_class(queryset, many=True).data))
+
+    def test_overridden_representation_is_kept(self):
+        plan = compile_fast_plan(UpperCaseUserSerializer)
+        queryset = get_user_model().objects.order_by('pk')
+        self.assertEqual([row['first_name'] for row in plan.to_representations(plan.project(queryset))],
+                         ['TEST'] * 3)
+        self.assertEqual(plan.to_representations(plan.project(queryset)),
+                         UpperCaseUserSerializer(queryset, many=True).data)
+
+    @override_settings(RATE_LIMIT_ENABLED=False)
+    def test_listing_matches_serializer(self):
+        data = self.client.get('/fh-api/v1/users/', {'page_size': 10}).json()
+        queryset = get_user_model().objects.filter(pk__in=[item['id'] for item in data['results']])
+        expected = {item['id']: item for item in json.loads(FastJSONRenderer().render(
+            UserSerializer(queryset, many=True).data))}
+        self.assertEqual(len(data['results']), 3)
+        for item in data['results']:
+            self.assertEqual(item, expected[item['id']])
+
+
+@override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_RULES=[(r'/users/login/?$', 'username', 5, 2, 60)])
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, username, **extra):
+        return self.client.post('/fh-api/v1/users/login/', json.dumps({'username': username, 'password': 'wrong'}),
+                                content_type='application/json', **extra)
+
+    def test_identifier_limit(self):
+        for attempt in range(2):
+            self.assertNotEqual(self.login('User@example.com').status_code, 429)
+        res = self.login('user@example.com ')
+        self.assertEqual(res.status_code, 429)
+        self.assertGreater(int(res['Retry-After']), 0)
+        self.assertIn('Too many attempts', res.json()['detail'])
+        self.assertNotEqual(self.login('other@example.com').status_code, 429)
+
+    def test_ip_limit(self):
+        statuses = [self.login('user%s@example.com' % number).status_code for number in range(6)]
+        self.assertNotIn(429, statuses[:5])
+        self.assertEqual(statuses[5], 429)
+        self.assertNotEqual(self.login('user6@example.com', REMOTE_ADDR='10.0.0.2').status_code, 429)
+
+    def test_forwarded_addresses_are_ignored(self):
+        statuses = [self.login('user%s@example.com' % number, HTTP_X_REAL_IP='10.1.0.%s' % number).status_code
+                    for number in range(6)]
+        self.assertEqual(statuses[5], 429)
+
+    @override_settings(RATE_LIMIT_TRUSTED_PROXIES=['127.0.0.1'])
+    def test_forwarded_addresses_from_trusted_proxies(self):
+        statuses = [self.login('user%s@example.com' % number, HTTP_X_REAL_IP='10.1.0.%s' % number).status_code
+                    for number in range(6)]
+        self.assertNotIn(429, statuses)
+        statuses = [self.login('user%s@example.com' % number, HTTP_X_REAL_IP='10.1.0.9').status_code
+                    for number in range(6)]
+        self.assertEqual(statuses[5], 429)
+
+    def test_other_paths_and_methods_are_not_limited(self):
+        for attempt in range(4):
+            self.assertNotEqual(self.client.get('/fh-api/v1/users/login/').status_code, 429)
+
+
+SHARED_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                             'LOCATION': tempfile.mkdtemp(prefix='backend-tests-')}}
+
+
+@override_settings(USER_CACHE_ENABLED=True, CACHES=SHARED_CACHES, RATE_LIMIT_ENABLED=False)
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.authentication = CachedJWTAuthentication()
+
+    def authenticate(self, user=None):
+        tokens = get_tokens_for_user(user or self.user)
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Bearer %s' % tokens['access'])
+        return self.authentication.authenticate(request)[0]
+
+    def test_cache_hit(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertTrue(user.is_active)
+        self.assertIn('password', user.get_deferred_fields())
+
+    def test_save_invalidates(self):
+        self.authenticate()
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertTrue(self.authenticate().is_superuser)
+
+    def test_inactive_user(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_needs_a_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            CachedJWTAuthentication()
+
+    def test_password_change_keeps_other_columns(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % get_tokens_for_user(self.user)['access'])
+        self.authenticate()
+        # Another worker deactivates the user without this process' cache noticing
+        get_user_model().objects.filter(pk=self.user.pk).update(is_separated=True, token_version=5)
+        res = client.post('/fh-api/v1/users/password_change/', {'old_password': 'secret123',
+                                                                'new_password': 'changed123'}, format='json')
+        self.assertEqual(res.status_code, 200, res.content)
+        user = get_user_model().objects.get(pk=self.user.pk)
+        self.assertTrue(user.is_separated)
+        self.assertEqual(user.token_version, 6)
+        self.assertTrue(user.check_password('changed123'))
+
+
+class ExplainHotQueriesTests(TestCase):
+
+    def test_hot_queries_use_their_indexes(self):
+        out = StringIO()
+        call_command('explain_hot_queries', check=True, verbose_plans=True, stdout=out)
+        output = out.getvalue()
+        self.assertNotIn('NO INDEX', output)
+        for index in ('user_active_mobile_idx', 'otplogin_active_mobile_idx', 'lower_idx'):
+            self.assertIn(index, output)
+
+    def test_check_fails_without_the_index(self):
+        queries = explain_hot_queries.get_hot_queries()[:1]
+        queries = [(label, 'missing_idx', queryset) for label, index, queryset in queries]
+        with mock.patch.object(explain_hot_queries, 'get_hot_queries', return_value=queries):
+            with self.assertRaises(CommandError):
+                call_command('explain_hot_queries', check=True, stdout=StringIO())
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class PasswordRehashTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        # An old, cheaper PBKDF2 hash, written without going through save()
+        old_hash = hashers.PBKDF2PasswordHasher().encode('secret123', hashers.PBKDF2PasswordHasher().salt(), 1000)
+        get_user_model().objects.filter(pk=self.user.pk).update(password=old_hash)
+        self.user = get_user_model().objects.get(pk=self.user.pk)
+
+    def assertUpgraded(self):
+        user = get_user_model().objects.get(pk=self.user.pk)
+        self.assertTrue(user.password.startswith('scrypt$'), user.password)
+        self.assertEqual(user.token_version, self.user.token_version)
+        self.assertTrue(user.check_password('secret123'))
+
+    def test_check_password_upgrades_the_hash(self):
+        self.assertFalse(self.user.check_password('wrong'))
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(self.user.check_password('secret123'))
+        self.assertUpgraded()
+
+    def test_login_upgrades_the_hash_and_keeps_tokens(self):
+        tokens = get_tokens_for_user(self.user)
+        res = self.client.post('/fh-api/v1/users/login/', {'username': 'user@example.com', 'password': 'secret123'},
+                               content_type='application/json')
+        self.assertEqual(res.status_code, 200, res.content)
+        self.assertUpgraded()
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Bearer %s' % tokens['access'])
+        self.assertIsNotNone(TokenUserAuthentication().authenticate(request))
+
+
+@override_settings(RATE_LIMIT_ENABLED=False)
+class LoginModeTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.logged_in = []
+        user_logged_in.connect(self.receiver)
+        self.addCleanup(user_logged_in.disconnect, self.receiver)
+
+    def receiver(self, sender, request, user, **kwargs):
+        self.logged_in.append(user.pk)
+
+    def login(self):
+        res = self.client.post('/fh-api/v1/users/login/', {'username': 'user@example.com', 'password': 'secret123'},
+                               content_type='application/json')
+        self.assertEqual(res.status_code, 200, res.content)
+        self.assertIn('access', res.json())
+        return res
+
+    @override_settings(AUTH_LOGIN_MODE='stateless')
+    def test_stateless_login(self):
+        res = self.login()
+        self.assertFalse(Session.objects.exists())
+        self.assertNotIn('sessionid', res.cookies)
+        self.assertEqual(self.logged_in, [self.user.pk])
+
+    @override_settings(AUTH_LOGIN_MODE='session', SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_session_login(self):
+        self.login()
+        self.assertEqual(Session.objects.count(), 1)
+        self.assertEqual(self.logged_in, [self.user.pk])
+
+
+@override_settings(RATE_LIMIT_ENABLED=False, AUTOCOMPLETE_INDEX_TTL=300, AUTOCOMPLETE_MAX_PENDING=10)
+class UserDirectoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        directory.user_directory.index, directory.user_directory.pending = None, {}
+        self.addCleanup(setattr, directory.user_directory, 'index', None)
+        User = get_user_model()
+        self.anand = User.objects.create_user('Anand', 'Kumar', '9000000001', 'anand@example.com', 'secret123',
+                                              is_active=True)
+        self.ananya = User.objects.create_user('Ananya', 'Rao', '9000000002', 'ananya@example.com', 'secret123',
+                                               is_active=True)
+        self.bala = User.objects.create_user('Bala', 'Anand', '9100000003', 'bala@example.com', 'secret123',
+                                             is_active=True)
+
+    def search(self, query, limit=10):
+        return [item['id'] for item in directory.user_directory.search(query, limit)]
+
+    def test_prefix_matching(self):
+        # Closest (shortest) terms first, then by pk
+        self.assertEqual(self.search('anan'), [self.anand.pk, self.bala.pk, self.ananya.pk])
+        self.assertEqual(self.search('anand'), [self.anand.pk, self.bala.pk])
+        self.assertEqual(self.search('ANA', limit=2), [self.anand.pk, self.bala.pk])
+        self.assertEqual(self.search('anand ku'), [self.anand.pk])
+        self.assertEqual(self.search('91'), [self.bala.pk])
+        self.assertEqual(self.search('zz'), [])
+        self.assertEqual(self.search(''), [])
+        self.assertEqual(directory.user_directory.search('ananya')[0], {'id': self.ananya.pk,
+                                                                         'name': self.ananya.display_name})
+
+    def test_saves_and_deactivations_are_seen_before_a_rebuild(self):
+        index = directory.user_directory.get_index()
+        self.bala.first_name = 'Zubin'
+        self.bala.save()
+        self.ananya.is_active = False
+        self.ananya.save()
+        self.assertIs(directory.user_directory.get_index(), index)
+        self.assertEqual(self.search('zub'), [self.bala.pk])
+        self.assertEqual(self.search('ana'), [self.anand.pk, self.bala.pk])
+        self.anand.delete()
+        self.assertEqual(self.search('ana'), [self.bala.pk])
+
+    def test_rebuilt_after_the_ttl(self):
+        index = directory.user_directory.get_index()
+        self.bala.first_name = 'Zubin'
+        self.bala.save()
+        with mock.patch.object(directory.time, 'monotonic', return_value=index.built_at + 301):
+            rebuilt = directory.user_directory.get_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(directory.user_directory.pending, {})
+        self.assertEqual(self.search('zub'), [self.bala.pk])
+
+    def test_rebuilt_after_too_many_changes(self):
+        index = directory.user_directory.get_index()
+        directory.user_directory.pending = {pk: None for pk in range(10 ** 6, 10 ** 6 + 11)}
+        self.assertIsNot(directory.user_directory.get_index(), index)
+
+    def test_superusers_only(self):
+        url = '/fh-api/v1/users/autocomplete/'
+        self.assertIn(self.client.get(url, {'query': 'ana'}).status_code, (401, 403))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % get_tokens_for_user(self.anand)['access'])
+        self.assertEqual(client.get(url, {'query': 'ana'}).status_code, 403)
+
+        self.anand.is_superuser = True
+        self.anand.save()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % get_tokens_for_user(self.anand)['access'])
+        res = client.get(url, {'query': 'ana', 'limit': 1})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json(), [{'id': self.anand.pk, 'name': self.anand.display_name}])
+        self.assertEqual(client.get(url, {'query': 'ana', 'limit': 'x'}).status_code, 400)
+
+
+class DerivedNameBackfillTests(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        create_user(email='first@example.com', mobile='9000000001')
+        create_user(email='middle@example.com', mobile='9000000002', middle_name='Kumar')
+        User.objects.create_user('', '', '9000000003', 'nameless@example.com', is_active=True)
+        # Written like a bulk import would, skipping save()
+        User.objects.update(full_name='', display_name='', search_text='')
+
+    def assertBackfilled(self):
+        for user in get_user_model().objects.all():
+            full_name = short_data.join_name(user.first_name, user.middle_name, user.last_name)
+            self.assertEqual(user.full_name, full_name)
+            self.assertEqual(user.display_name,
+                             short_data.get_display_name(full_name, user.email, user.username, user.mobile))
+            self.assertEqual(user.search_text, search.build_search_text(user))
+
+    def test_backfill_command(self):
+        out = StringIO()
+        call_command('backfill_user_fields', batch_size=2, stdout=out)
+        self.assertIn('Updated 3 users', out.getvalue())
+        self.assertBackfilled()
+        self.assertEqual(get_user_model().objects.get(email='middle@example.com').full_name, 'Test Kumar User')
+        self.assertEqual(get_user_model().objects.get(email='nameless@example.com').display_name,
+                         'nameless@example.com')
+
+        out = StringIO()
+        call_command('backfill_user_fields', stdout=out)
+        self.assertIn('Updated 0 users', out.getvalue())
+
+    def test_migration_matches_the_model(self):
+        migration = importlib.import_module('backend.accounts.migrations.0006_user_full_name_display_name')
+        migration.backfill_names(apps, mock.Mock(connection=connection))
+        for user in get_user_model().objects.all():
+            full_name = short_data.join_name(user.first_name, user.middle_name, user.last_name)
+            self.assertEqual(user.full_name, full_name)
+            self.assertEqual(user.display_name,
+                             short_data.get_display_name(full_name, user.email, user.username, user.mobile))
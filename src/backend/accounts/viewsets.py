@@ -1,5 +1,4 @@
 import logging
-from datetime import datetime, date, timedelta
 from functools import partial
 
 from django.conf import settings
@@ -12,8 +11,10 @@ from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.decorators import action
 
+from .directory import user_directory
 from .filters import UserBasicFilter
-from .models import PasswordResetCode, OTPLogin
+from .models import PasswordResetCode
+from .otp import generate_otp, get_otp_store
 from .permissions import UserPermissions
 from .serializers import UserSerializer, PasswordResetSerializer, UserBasicDataSerializer, UserRegistrationSerializer, \
     UserRegisterSerializer
@@ -21,11 +22,11 @@ from .services import auth_login, auth_password_change, _parse_data, \
     get_user_from_email_or_mobile_or_employee_code, generate_auth_data, user_clone_api
 
 from ..base import response
-from ..base.api.pagination import StandardResultsSetPagination
+from ..base.api.pagination import KeysetPagination, OptionalEstimatedCountPagination
 from ..base.api.viewsets import ModelViewSet
 from ..base.serializers import SawaggerResponseSerializer
 from ..base.services import create_update_record
-from ..base.utils.sms import send_sms_without_save
+from ..base.utils.sms import enqueue_sms
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +42,9 @@ class UserViewSet(ModelViewSet):
     serializer_class = UserSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = None
+    pagination_class = OptionalEstimatedCountPagination
+    keyset_pagination_class = KeysetPagination
+    fast_serialization = True
 
     def get_queryset(self):
         queryset = super(UserViewSet, self).get_queryset()
@@ -91,8 +95,12 @@ class UserViewSet(ModelViewSet):
     )
     @action(detail=False, methods=['POST'])
     def password_change(self, request):
+        if not request.user.is_authenticated:
+            content = {'detail': 'user is not authenticated'}
+            return response.Unauthorized(content)
         data = auth_password_change(request)
-        user, new_password = request.user, data.get('new_password')
+        # request.user may be a cached, partial copy; a save must not write back stale columns
+        user, new_password = get_user_model().objects.get(pk=request.user.pk), data.get('new_password')
         if new_password:
             if len(new_password) < 6:
                 return response.BadRequest({"detail": "Password too short."})
@@ -148,12 +156,39 @@ class UserViewSet(ModelViewSet):
             message = {'detail': 'User for this staff does not exist'}
             return response.BadRequest(message)
 
+    @swagger_auto_schema(
+        method="get",
+        operation_summary='User Autocomplete',
+        operation_description='Active users with a name, email, mobile or username word starting with `query`.',
+        manual_parameters=[
+            openapi.Parameter('query', openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description="default 10, max 50"),
+        ]
+    )
+    @action(detail=False, methods=['GET'])
+    def autocomplete(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return response.BadRequest({'detail': 'limit should be a number'})
+        return response.Ok(user_directory.search(request.query_params.get('query', ''), limit))
+
     @action(detail=False, methods=['GET', 'POST', 'PUT'], serializer_class=UserRegistrationSerializer)
     def register(self, request):
         if request.method == 'GET':
             queryset = get_user_model().objects.filter(is_active=True)
             self.filterset_class = UserBasicFilter
             queryset = self.filter_queryset(queryset)
+            if self.should_stream(request):
+                return self.stream_queryset(queryset, UserRegisterSerializer)
+            plan = self.get_fast_plan(UserRegisterSerializer)
+            if plan is not None:
+                rows = plan.project(queryset)
+                page = self.paginate_queryset(rows)
+                if page is not None:
+                    return self.get_paginated_response(plan.to_representations(page))
+                return response.Ok(plan.to_representations(rows))
+            queryset = self.plan_queryset(queryset, UserRegisterSerializer)
             page = self.paginate_queryset(queryset)
             if page is not None:
                 return self.get_paginated_response(UserRegisterSerializer(page, many=True).data)
@@ -211,19 +246,14 @@ class UserViewSet(ModelViewSet):
 
     @action(detail=False, methods=['POST'])
     def resend_otp(self, request):
-        import datetime
         mobile = request.data.get("mobile")
         user_model = get_user_model()
         user = user_model.objects.filter(is_active=True, mobile=mobile).first()
         if user:
-            timestamp = datetime.datetime.now() - datetime.timedelta(minutes=15)
-            login_obj = OTPLogin.objects.filter(mobile=mobile, is_active=True, modified_at__gte=timestamp,
-                                                resend_counter__gt=0).first()
-            if login_obj:
-                send_sms_without_save(mobile, "Your OTP for My Fitnezz Login is " + str(
-                    login_obj.otp) + ". It is valid for next 10 minutes.")
-                login_obj.resend_counter = login_obj.resend_counter - 1
-                login_obj.save()
+            otp = get_otp_store().resend(mobile)
+            if otp is not None:
+                enqueue_sms(mobile, "Your OTP for My Fitnezz Login is " + str(
+                    otp) + ". It is valid for next 10 minutes.")
                 return response.Ok({"detail": "OTP resent successfully"})
             else:
                 return response.BadRequest(
@@ -237,19 +267,9 @@ class UserViewSet(ModelViewSet):
         user_model = get_user_model()
         user = user_model.objects.filter(is_active=True, mobile=mobile).first()
         if user:
-            otp = self.get_random_number(6)
-            OTPLogin.objects.filter(mobile=mobile, modified_at__lt=date.today(), is_active=True).delete()
-            login_obj = OTPLogin.objects.filter(mobile=mobile, is_active=True, modified_at__gte=date.today()).first()
-            if login_obj:
-                counter = login_obj.counter - 1
-                if counter > 0:
-                    OTPLogin.objects.filter(mobile=mobile, is_active=True, modified_at__gte=date.today()).update(
-                        otp=otp, is_active=True, counter=counter, resend_counter=25, modified_at=datetime.now())
-            else:
-                counter = 25
-                OTPLogin.objects.create(mobile=mobile, otp=otp)
-            if counter > 0:
-                send_sms_without_save(mobile, "Your OTP for My Fitnezz Login is " + str(
+            otp = generate_otp(6)
+            if get_otp_store().issue(mobile, otp):
+                enqueue_sms(mobile, "Your OTP for My Fitnezz Login is " + str(
                     otp) + ". It is valid for next 10 minutes.")
                 return response.Ok({"detail": "OTP sent successfully"})
             else:
@@ -265,12 +285,7 @@ class UserViewSet(ModelViewSet):
         user_model = get_user_model()
         user = user_model.objects.filter(is_active=True, mobile=mobile).first()
         if user:
-            timestamp = datetime.now() - timedelta(minutes=15)
-            login_obj = OTPLogin.objects.filter(mobile=mobile, otp=otp, is_active=True,
-                                                modified_at__gte=timestamp).first()
-            if login_obj:
-                login_obj.is_active = False
-                login_obj.save()
+            if get_otp_store().verify(mobile, otp):
                 auth_data = generate_auth_data(request, user)
                 return response.Ok(auth_data)
             else:
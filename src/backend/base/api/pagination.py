@@ -1,11 +1,26 @@
+import hashlib
 import json
-from collections import OrderedDict
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
 
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
 from rest_framework.response import Response
 
 
 class DefaultPageNumberPagination(PageNumberPagination):
+    # With False, listings are only paginated when the request sends a page or page size param
+    paginate_by_default = True
+    # `?pagination=false` turns pagination off (and streams the listing, see ModelViewSet.should_stream)
+    pagination_query_param = 'pagination'
+
     def get_paginated_response(self, data):
         extra = None
         if not hasattr(self, 'page'):
@@ -15,22 +30,235 @@ class DefaultPageNumberPagination(PageNumberPagination):
             data = data.get('data', [])
         next_page = self.page.number + 1 if self.get_next_link() else None
         prev_page = self.page.number - 1 if self.get_previous_link() else None
-        return Response(OrderedDict([
-            ('count', self.page.paginator.count),
-            ('current', self.page.number),
-            ('next', next_page),
-            ('previous', prev_page),
-            ('extra', extra),
-            ('results', data)
-        ]))
+        return Response({
+            'count': self.page.paginator.count,
+            'current': self.page.number,
+            'next': next_page,
+            'previous': prev_page,
+            'extra': extra,
+            'results': data,
+        })
+
+    def get_django_paginator(self, queryset, page_size):
+        return self.django_paginator_class(queryset, page_size)
+
+    def is_unpaginated(self, request):
+        if self.pagination_query_param in request.query_params:
+            return not json.loads(request.query_params[self.pagination_query_param])
+        if self.paginate_by_default:
+            return False
+        return not any(param and param in request.query_params
+                       for param in (self.page_query_param, self.page_size_query_param))
 
     def paginate_queryset(self, queryset, request, view=None):
-        if not json.loads(request.query_params.get("pagination", "true")):
+        if self.is_unpaginated(request):
             return queryset
-        return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.get_django_paginator(queryset, page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        if paginator.num_pages > 1 and self.template is not None:
+            # The browsable API should display pagination controls.
+            self.display_page_controls = True
+        return list(self.page)
 
 
 class StandardResultsSetPagination(DefaultPageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 2000
+
+
+class EstimatedCountPaginator(DjangoPaginator):
+    """
+    Paginator whose `count` avoids a full `COUNT(*)` where it can:
+
+    - counts are cached for `cache_timeout` seconds, keyed by the SQL of the filtered queryset
+    - on PostgreSQL, the planner's row estimate is used when it is at least `estimate_threshold`
+    - `exact=True` always runs the real count (and refreshes the cache)
+    """
+
+    def __init__(self, object_list, per_page, estimate_threshold=None, cache_timeout=None, exact=False, **kwargs):
+        super(EstimatedCountPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.estimate_threshold = estimate_threshold
+        self.cache_timeout = cache_timeout
+        self.exact = exact
+        self.is_estimate = False
+
+    def get_cache_key(self):
+        if not isinstance(self.object_list, QuerySet):
+            return None
+        try:
+            sql = str(self.object_list.query)
+        except Exception:
+            return None
+        return 'pagination:count:%s' % hashlib.md5(sql.encode('utf8')).hexdigest()
+
+    def estimate_count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or connections[queryset.db].vendor != 'postgresql':
+            return None
+        sql, params = queryset.query.sql_with_params()
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    @cached_property
+    def count(self):
+        cache_key = self.get_cache_key() if self.cache_timeout else None
+        if cache_key and not self.exact:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                self.is_estimate = cached[1]
+                return cached[0]
+
+        count = None
+        if not self.exact and self.estimate_threshold is not None:
+            estimate = self.estimate_count()
+            if estimate is not None and estimate >= self.estimate_threshold:
+                count, self.is_estimate = estimate, True
+        if count is None:
+            count = super(EstimatedCountPaginator, self).count
+
+        if cache_key:
+            cache.set(cache_key, (count, self.is_estimate), self.cache_timeout)
+        return count
+
+
+class EstimatedCountPagination(StandardResultsSetPagination):
+    """
+    Page number pagination that reports planner estimates for large result sets, see `EstimatedCountPaginator`.
+    `count_is_estimate` tells whether `count` is an estimate; send `?count=exact` to force an exact count.
+    """
+    django_paginator_class = EstimatedCountPaginator
+    count_query_param = 'count'
+    count_estimate_threshold = settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD
+    count_cache_timeout = settings.PAGINATION_COUNT_CACHE_TIMEOUT
+
+    def get_django_paginator(self, queryset, page_size):
+        exact = self.request.query_params.get(self.count_query_param) == 'exact'
+        return self.django_paginator_class(queryset, page_size, estimate_threshold=self.count_estimate_threshold,
+                                           cache_timeout=self.count_cache_timeout, exact=exact)
+
+    def get_paginated_response(self, data):
+        response = super(EstimatedCountPagination, self).get_paginated_response(data)
+        if hasattr(self, 'page'):
+            response.data['count_is_estimate'] = self.page.paginator.is_estimate
+        return response
+
+
+class OptionalEstimatedCountPagination(EstimatedCountPagination):
+    """`EstimatedCountPagination` for listings that return a plain list unless `page` or `page_size` is sent."""
+    paginate_by_default = False
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over a unique ordering, `(created_at, id)` newest first by default.
+
+    Pages are selected with a `WHERE (ordering) > (last seen values)` condition instead of OFFSET,
+    so every page costs the same however deep it is. Cursors are opaque strings; an empty
+    `?cursor=` requests the first page. A view can pick its own ordering with `keyset_ordering`,
+    which must end with a unique, non-null field.
+    The response keeps the page number envelope, with cursors in `current`/`next`/`previous`
+    and `count` left empty.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 2000
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        ordering = getattr(view, 'keyset_ordering', None) or self.ordering
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.model_fields = [queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+                             for name, descending in self.fields]
+
+        self.current = request.query_params.get(self.cursor_query_param) or None
+        position, reverse = self.decode_cursor(self.current) if self.current else (None, False)
+
+        order_by = [('-' if descending != reverse else '') + name for name, descending in self.fields]
+        queryset = queryset.order_by(*order_by)
+        names, deferred = queryset.query.deferred_loading
+        if names and not deferred:
+            # The cursors read the ordering columns of the first and last rows
+            queryset = queryset.only(*set(names).union(name for name, descending in self.fields))
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position, reverse))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.next = self.previous = None
+        if results:
+            if has_more or reverse:
+                self.next = self.encode_cursor(results[-1], reverse=False)
+            if (has_more and reverse) or (position is not None and not reverse):
+                self.previous = self.encode_cursor(results[0], reverse=True)
+        return results
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(request.query_params[self.page_size_query_param], strict=True,
+                                     cutoff=self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_position_filter(self, position, reverse):
+        """(a, b) > (x, y) expanded to `a > x OR (a = x AND b > y)`, honouring each field's direction."""
+        conditions = []
+        for index, (name, descending) in enumerate(self.fields):
+            lookup = '%s__%s' % (name, 'lt' if descending != reverse else 'gt')
+            equal = {prefix_name: value for (prefix_name, _), value in zip(self.fields[:index], position)}
+            conditions.append(Q(**equal) & Q(**{lookup: position[index]}))
+        return reduce(lambda acc, condition: acc | condition, conditions)
+
+    def encode_cursor(self, instance, reverse):
+        position = [field.value_to_string(instance) for field in self.model_fields]
+        payload = json.dumps({'p': position, 'r': reverse}, separators=(',', ':')).encode('utf8')
+        return urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            position = [field.to_python(value) for field, value in zip(self.model_fields, payload['p'])]
+            if len(position) != len(self.model_fields):
+                raise ValueError
+            return position, bool(payload.get('r'))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_paginated_response(self, data):
+        extra = None
+        if type(data) == type(dict()):
+            extra = data.get("extra", None)
+            data = data.get('data', [])
+        return Response({
+            'count': None,
+            'current': self.current,
+            'next': self.next,
+            'previous': self.previous,
+            'extra': extra,
+            'results': data,
+        })
@@ -0,0 +1,23 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from .renderers import orjson
+
+
+class FastJSONParser(JSONParser):
+    """
+    `JSONParser` decoding with orjson when it is installed.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super(FastJSONParser, self).parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            data = stream.read()
+            if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -15,6 +15,9 @@ from ..utils import sequence as sq
 class ResourcePermission(BasePermission):
     """
     Base class for define resource permissions.
+
+    The permission set of every (permission class, action) pair is built and
+    flattened once per process by `get_permission_plan`, then reused.
     """
 
     enough_perms = None
@@ -26,7 +29,7 @@ class ResourcePermission(BasePermission):
     destroy_perms = None
     list_perms = None
 
-    def has_action_permission(self, request, view, action, obj=None):
+    def build_permset(self, action):
         permset = getattr(self, "{}_perms".format(action))
 
         if isinstance(permset, (list, tuple)):
@@ -49,6 +52,18 @@ class ResourcePermission(BasePermission):
         if self.enough_perms:
             permset = (self.enough_perms | permset)
 
+        return permset
+
+    def get_permission_plan(self, action):
+        key = (self.__class__, action)
+        plan = _permission_plans.get(key)
+        if plan is None:
+            plan = _permission_plans[key] = compile_permset(self.build_permset(action))
+        return plan
+
+    def has_action_permission(self, request, view, action, obj=None):
+        permset = self.get_permission_plan(action)
+
         if obj is None:
             return permset.has_permission(request=request, view=view)
 
@@ -108,24 +123,16 @@ class Or(PermissionOperator):
     """
 
     def has_permission(self, *args, **kwargs):
-        valid = False
-
         for component in self.components:
             if component.has_permission(*args, **kwargs):
-                valid = True
-                break
-
-        return valid
+                return True
+        return False
 
     def has_object_permission(self, *args, **kwargs):
-        valid = False
-
         for component in self.components:
             if component.has_object_permission(*args, **kwargs):
-                valid = True
-                break
-
-        return valid
+                return True
+        return False
 
 
 class And(PermissionOperator):
@@ -134,24 +141,50 @@ class And(PermissionOperator):
     """
 
     def has_permission(self, *args, **kwargs):
-        valid = True
-
         for component in self.components:
             if not component.has_permission(*args, **kwargs):
-                valid = False
-                break
-
-        return valid
+                return False
+        return True
 
     def has_object_permission(self, *args, **kwargs):
-        valid = True
-
         for component in self.components:
             if not component.has_object_permission(*args, **kwargs):
-                valid = False
-                break
+                return False
+        return True
+
+
+# Compiled permission sets, keyed by (permission class, action)
+_permission_plans = {}
+
+
+def compile_permset(component):
+    """
+    Returns an equivalent permission component with nested `And`/`Or` operators
+    collapsed into a single flat tuple of components per operator.
+    """
+    operator = type(component)
+    if operator is Not:
+        return Not(compile_permset(sq.first(component.components)))
+    if operator not in (And, Or):
+        return component
+
+    components = []
+    for child in component.components:
+        child = compile_permset(child)
+        if type(child) is operator:
+            components.extend(child.components)
+        elif type(child) is AllowAny:
+            # AllowAny decides an Or and is a no-op inside an And
+            if operator is Or:
+                return child
+        else:
+            components.append(child)
 
-        return valid
+    if operator is And and not components:
+        return AllowAny()
+    if len(components) == 1:
+        return components[0]
+    return operator(*components)
 
 
 ######################################################################
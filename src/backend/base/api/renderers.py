@@ -0,0 +1,45 @@
+import json
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = encoders.JSONEncoder()
+
+if orjson is not None:
+    # datetimes, dates, times and UUIDs are encoded by orjson itself; the rest
+    # (Decimal, lazy strings, timedelta, querysets...) the way DRF's encoder does
+    _ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    # orjson has no Decimal support; they are the bulk of what reaches here, so skip DRF's isinstance chain
+    if type(obj) is Decimal:
+        return float(obj)
+    return _encoder.default(obj)
+
+
+def dumps(data):
+    """`data` as compact utf-8 JSON bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf8')
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    `JSONRenderer` encoding with orjson when it is installed, else the stdlib as DRF does.
+    Indented output (e.g. `Accept: application/json; indent=4`) always goes through DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        return dumps(data)
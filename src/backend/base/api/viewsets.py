@@ -1,7 +1,12 @@
+from django.conf import settings
+from django.db.models.query import ModelIterable
 from rest_framework import mixins
 from rest_framework.viewsets import ViewSetMixin as DRF_ViewSetMixin
 
 from ..api import generics, views
+from ..api.pagination import DefaultPageNumberPagination
+from .. import response
+from ..serializers import get_fast_plan, plan_queryset
 
 
 class ViewSetMixin(DRF_ViewSetMixin):
@@ -48,5 +53,93 @@ class ModelViewSet(mixins.CreateModelMixin,
     """
     A viewset that provides default `create()`, `retrieve()`, `update()`,
     `partial_update()`, `destroy()` and `list()` actions.
+
+    Set `keyset_pagination_class` to let clients switch to keyset pagination
+    by sending its cursor query param (`?cursor=` for the first page).
+
+    Set `fast_serialization` to build page number and streamed listings from `values_list()` rows
+    when the serializer allows it (see `base.serializers.FastPlan`).
     """
-    pass
+    keyset_pagination_class = None
+    fast_serialization = False
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            pagination_class = self.pagination_class
+            keyset_class = self.keyset_pagination_class
+            if keyset_class is not None and keyset_class.cursor_query_param in self.request.query_params:
+                pagination_class = keyset_class
+            self._paginator = pagination_class() if pagination_class is not None else None
+        return self._paginator
+
+    def should_stream(self, request):
+        """
+        Listings explicitly unpaginated with `?pagination=false` are streamed instead of built in memory.
+        Other unpaginated listings (see `paginate_by_default`) are rendered as usual.
+        """
+        paginator = self.paginator
+        return isinstance(paginator, DefaultPageNumberPagination) and \
+            paginator.pagination_query_param in request.query_params and paginator.is_unpaginated(request)
+
+    def paginate_queryset(self, queryset):
+        """None when the request isn't paginated, so the listing is returned as a plain list."""
+        paginator = self.paginator
+        if isinstance(paginator, DefaultPageNumberPagination) and paginator.is_unpaginated(self.request):
+            return None
+        return super(ModelViewSet, self).paginate_queryset(queryset)
+
+    def get_fast_plan(self, serializer_class=None):
+        """The `FastPlan` for listings, None when disabled or when the keyset paginator needs instances."""
+        if not self.fast_serialization:
+            return None
+        if self.paginator is not None and not isinstance(self.paginator, DefaultPageNumberPagination):
+            return None
+        return get_fast_plan(serializer_class or self.get_serializer_class())
+
+    def plan_queryset(self, queryset, serializer_class=None):
+        """
+        `queryset` with the serializer's `QueryPlan` applied. Paginators hand the serializer a list,
+        which it can't plan any more, so listings plan the queryset before paginating it.
+        """
+        if not issubclass(queryset._iterable_class, ModelIterable):
+            return queryset
+        serializer_class = serializer_class or self.get_serializer_class()
+        serializer = serializer_class(context=self.get_serializer_context())
+        return plan_queryset(serializer, queryset.model).apply(queryset)
+
+    def stream_queryset(self, queryset, serializer_class=None):
+        serializer_class = serializer_class or self.get_serializer_class()
+        serializer = serializer_class(many=True, context=self.get_serializer_context())
+        plan = self.get_fast_plan(serializer_class)
+        if plan is not None:
+            items = (plan.to_representation(row)
+                     for row in plan.project(queryset).iterator(chunk_size=settings.STREAMING_CHUNK_SIZE))
+        elif hasattr(serializer, 'iter_representation'):
+            items = serializer.iter_representation(queryset, chunk_size=settings.STREAMING_CHUNK_SIZE)
+        else:
+            items = (serializer.child.to_representation(item)
+                     for item in queryset.iterator(chunk_size=settings.STREAMING_CHUNK_SIZE))
+        return response.StreamingJSONResponse(items)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.should_stream(request):
+            return self.stream_queryset(queryset)
+
+        plan = self.get_fast_plan()
+        if plan is not None:
+            rows = plan.project(queryset)
+            page = self.paginate_queryset(rows)
+            if page is not None:
+                return self.get_paginated_response(plan.to_representations(page))
+            return response.Ok(plan.to_representations(rows))
+
+        queryset = self.plan_queryset(queryset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return response.Ok(serializer.data)
@@ -0,0 +1,161 @@
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+_missing = object()
+
+# Striped locks, so concurrent misses on the same key in one process compute it once
+_locks = [threading.Lock() for _ in range(64)]
+
+# Namespace versions read by this process, `(alias, name) -> (version, read at)`
+_versions = {}
+
+# Backends whose entries are only seen by the process that wrote them
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def _local_lock(key):
+    return _locks[zlib.crc32(key.encode('utf8')) % len(_locks)]
+
+
+class Namespace(object):
+    """
+    A group of cache keys sharing a prefix and a version.
+
+    - keys are stored as `<name>:<version>:<key>`, so `invalidate()` drops the whole namespace at once
+      by bumping the version (old entries just expire)
+    - every write can pass its own `timeout`, defaulting to the namespace's
+    - `get_or_set` recomputes a missing value once: other threads of the process wait on a lock
+      and other processes wait (up to `lock_timeout` seconds) for the value to show up
+    - the version is kept in process memory for `version_ttl` seconds, so a read or write is one
+      cache round trip; an `invalidate()` from another process is seen within that delay
+
+    usage:
+        users = Namespace('users', timeout=300)
+        user = users.get_or_set(user_id, lambda: User.objects.get(pk=user_id))
+        users.delete(user_id)
+    """
+
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT, alias=None, lock_timeout=10, version_ttl=5):
+        self.name = name
+        self.timeout = timeout
+        self.alias = alias
+        self.lock_timeout = lock_timeout
+        self.version_ttl = version_ttl
+
+    @property
+    def cache_alias(self):
+        return self.alias or getattr(settings, 'BASE_CACHE_ALIAS', DEFAULT_CACHE_ALIAS)
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def is_shared(self):
+        """Whether every process sees this namespace, so a delete in one of them reaches the others."""
+        return settings.CACHES[self.cache_alias]['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+    @property
+    def version_key(self):
+        return '%s:version' % self.name
+
+    def get_version(self, refresh=False):
+        now = time.monotonic()
+        local = _versions.get((self.cache_alias, self.name))
+        if not refresh and local is not None and now - local[1] < self.version_ttl:
+            return local[0]
+        version = self.cache.get(self.version_key)
+        if version is None:
+            self.cache.add(self.version_key, 1, None)
+            version = self.cache.get(self.version_key, 1)
+        self.remember_version(version, now)
+        return version
+
+    def remember_version(self, version, now=None):
+        _versions[(self.cache_alias, self.name)] = (version, time.monotonic() if now is None else now)
+
+    def make_key(self, key, version=None):
+        return '%s:%s:%s' % (self.name, version or self.get_version(), key)
+
+    def get(self, key, default=None):
+        return self.cache.get(self.make_key(key), default)
+
+    def get_many(self, keys):
+        version = self.get_version()
+        keys = {self.make_key(key, version): key for key in keys}
+        return {keys[cache_key]: value for cache_key, value in self.cache.get_many(list(keys)).items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.cache.set(self.make_key(key), value, self.get_timeout(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT):
+        version = self.get_version()
+        self.cache.set_many({self.make_key(key, version): value for key, value in data.items()},
+                            self.get_timeout(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT):
+        return self.cache.add(self.make_key(key), value, self.get_timeout(timeout))
+
+    def incr(self, key, delta=1):
+        """Atomic on backends with atomic increments (memcached, redis, db); raises ValueError for missing keys."""
+        return self.cache.incr(self.make_key(key), delta)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT):
+        return self.cache.touch(self.make_key(key), self.get_timeout(timeout))
+
+    def delete(self, key):
+        """Deletes the entry under the current version, and under this process' older one if it was bumped."""
+        local = self.get_version()
+        version = self.get_version(refresh=True)
+        if local != version:
+            self.cache.delete(self.make_key(key, local))
+        return self.cache.delete(self.make_key(key, version))
+
+    def invalidate(self):
+        try:
+            version = self.cache.incr(self.version_key)
+        except ValueError:
+            version = 2
+            self.cache.set(self.version_key, version, None)
+        self.remember_version(version)
+
+    def get_timeout(self, timeout):
+        return self.timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def get_or_set(self, key, compute, timeout=DEFAULT_TIMEOUT):
+        """Returns the cached value for `key`, calling `compute()` and caching its result on a miss."""
+        cache_key = self.make_key(key)
+        value = self.cache.get(cache_key, _missing)
+        if value is not _missing:
+            return value
+
+        with _local_lock(cache_key):
+            value = self.cache.get(cache_key, _missing)
+            if value is not _missing:
+                return value
+
+            lock_key = cache_key + ':lock'
+            if not self.cache.add(lock_key, 1, self.lock_timeout):
+                # Another process is computing it
+                deadline = time.monotonic() + self.lock_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    value = self.cache.get(cache_key, _missing)
+                    if value is not _missing:
+                        return value
+                lock_key = None
+            try:
+                value = compute()
+                self.cache.set(cache_key, value, self.get_timeout(timeout))
+            finally:
+                if lock_key:
+                    self.cache.delete(lock_key)
+        return value
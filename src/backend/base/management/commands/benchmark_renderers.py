@@ -0,0 +1,41 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from ...api import renderers
+from ...utils.benchmark import best
+
+
+def make_page(rows):
+    """A page number envelope like `DefaultPageNumberPagination` returns, with typical column types."""
+    now = datetime.now(timezone.utc)
+    results = [{
+        'id': index,
+        'uuid': uuid.uuid4(),
+        'email': 'user-%s@example.com' % index,
+        'full_name': 'Firstname Lastname %s' % index,
+        'is_active': index % 2 == 0,
+        'amount': Decimal('%s.25' % index),
+        'created_at': now - timedelta(minutes=index),
+    } for index in range(rows)]
+    return {'count': rows, 'current': 1, 'next': 2, 'previous': None, 'extra': None, 'results': results}
+
+
+class Command(BaseCommand):
+    help = "Compare DRF's JSONRenderer with FastJSONRenderer on large paginated payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='2000,20000,100000', help="Comma separated page sizes")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write("orjson: %s" % ('installed' if renderers.orjson is not None else 'not installed, stdlib fallback'))
+        for rows in [int(rows) for rows in options['rows'].split(',')]:
+            data = make_page(rows)
+            drf = best(options['repeat'], lambda: JSONRenderer().render(data, 'application/json'))
+            fast = best(options['repeat'], lambda: renderers.FastJSONRenderer().render(data, 'application/json'))
+            self.stdout.write("%7d rows  JSONRenderer %7.3f s  FastJSONRenderer %7.3f s  x%.1f" % (
+                rows, drf, fast, drf / fast if fast else 0))
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import math
+import re
+import time
+
+from django.conf import settings
+
+from . import response
+from .api.renderers import FastJSONRenderer
+from .cache import Namespace
+
+
+class RateLimitMiddleware(object):
+    """
+    Sliding-window rate limits for the login / OTP endpoints, checked before the view runs.
+
+    `settings.RATE_LIMIT_RULES` is a list of `(path regex, identifier field, limit per IP,
+    limit per identifier, window seconds)`. Every POST to a matching path is counted once for
+    the client IP and once for the identifier read from the body (e.g. `username`), and is
+    answered with `response.TooManyRequests` when either count is over its limit.
+
+    The client IP is `REMOTE_ADDR`, or the `X-Real-IP` header when the request comes from one of
+    `settings.RATE_LIMIT_TRUSTED_PROXIES`; clients could otherwise send any address in that header.
+
+    The window is approximated from two fixed buckets: the current bucket's count plus the
+    previous one's weighted by how much of it still overlaps the window. Counts live in the cache,
+    so the limits are per process with the local memory cache and global with a shared one.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rules = [(re.compile(pattern), field, ip_limit, identifier_limit, window)
+                      for pattern, field, ip_limit, identifier_limit, window in settings.RATE_LIMIT_RULES]
+        self.cache = Namespace('ratelimit')
+
+    def __call__(self, request):
+        if settings.RATE_LIMIT_ENABLED and request.method == 'POST':
+            for index, (pattern, field, ip_limit, identifier_limit, window) in enumerate(self.rules):
+                if not pattern.search(request.path_info):
+                    continue
+                retry_after = self.check(request, index, field, ip_limit, identifier_limit, window)
+                if retry_after:
+                    return self.too_many_requests(retry_after)
+                break
+        return self.get_response(request)
+
+    def check(self, request, rule, field, ip_limit, identifier_limit, window):
+        """Counts the request, returns the seconds to wait when it is over a limit, else 0."""
+        retry_after = 0
+        keys = [('ip', self.get_client_ip(request), ip_limit)]
+        if field:
+            keys.append(('id', self.get_identifier(request, field), identifier_limit))
+        for scope, value, limit in keys:
+            if value and limit:
+                retry_after = max(retry_after, self.hit('%s:%s:%s' % (rule, scope, value), limit, window))
+        return retry_after
+
+    def hit(self, key, limit, window):
+        now = time.time()
+        bucket = int(now // window)
+        elapsed = now - bucket * window
+        key = hashlib.md5(key.encode('utf8')).hexdigest()
+        current_key, previous_key = '%s:%s' % (key, bucket), '%s:%s' % (key, bucket - 1)
+
+        if self.cache.add(current_key, 1, 2 * window):
+            current = 1
+        else:
+            try:
+                current = self.cache.incr(current_key)
+            except ValueError:
+                current = 1
+                self.cache.set(current_key, current, 2 * window)
+        previous = self.cache.get(previous_key) or 0
+        count = previous * (window - elapsed) / window + current
+        if count <= limit:
+            return 0
+        return max(1, int(math.ceil(window - elapsed)))
+
+    @staticmethod
+    def get_client_ip(request):
+        address = request.META.get('REMOTE_ADDR')
+        if address in settings.RATE_LIMIT_TRUSTED_PROXIES:
+            return request.META.get('HTTP_X_REAL_IP') or address
+        return address
+
+    @staticmethod
+    def get_identifier(request, field):
+        if len(request.body) > 16 * 1024:
+            return None
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                return None
+            value = data.get(field) if isinstance(data, dict) else None
+        else:
+            value = request.POST.get(field)
+        return str(value).strip().lower() if value else None
+
+    @staticmethod
+    def too_many_requests(retry_after):
+        resp = response.TooManyRequests({'detail': 'Too many attempts. Please retry after %s seconds.' % retry_after},
+                                        headers={'Retry-After': str(retry_after)})
+        resp.accepted_renderer = FastJSONRenderer()
+        resp.accepted_media_type = 'application/json'
+        resp.renderer_context = {}
+        resp.render()
+        return resp
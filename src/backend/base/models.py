@@ -15,6 +15,30 @@ class TimeStampedModel(models.Model):
         abstract = True
 
 
+class SMSOutbox(TimeStampedModel):
+    """
+    Outbound SMS messages. Rows stay `pending` until a dispatcher worker (or the outbox cron) claims them
+    by moving them to `sending`, so every message is delivered by a single sender. The body is blanked once
+    the row is `sent` or `failed`.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+    mobile = models.CharField(max_length=128)
+    body = models.TextField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+
 def upload_file(instance, image):
     """
     Stores the attachment in a "per rb-gallery/module-type/yyyy/mm/dd" folder.
@@ -3,6 +3,8 @@ from django import http
 
 import rest_framework.response
 
+from .api.renderers import dumps
+
 
 class Response(rest_framework.response.Response):
     def __init__(self, data=None, status=None, template_name=None, headers=None, exception=False,
@@ -24,6 +26,36 @@ class Ok(Response):
     status_code = 200
 
 
+class StreamingJSONResponse(http.StreamingHttpResponse):
+    """200 OK, streamed
+
+    Writes `items` as a JSON array while iterating it, so the full list is
+    never held in memory. Items are encoded like `FastJSONRenderer` does and
+    flushed in groups of `buffer_size`.
+    """
+    status_code = 200
+
+    def __init__(self, items, buffer_size=100, status=None, headers=None):
+        super(StreamingJSONResponse, self).__init__(self.stream(items, buffer_size), status=status,
+                                                    content_type='application/json', headers=headers)
+
+    @staticmethod
+    def encode(item):
+        return dumps(item)
+
+    @classmethod
+    def stream(cls, items, buffer_size):
+        buffer, separator = [b'['], b''
+        for item in items:
+            buffer.append(separator + cls.encode(item))
+            separator = b','
+            if len(buffer) >= buffer_size:
+                yield b''.join(buffer)
+                buffer = []
+        buffer.append(b']')
+        yield b''.join(buffer)
+
+
 class Created(Response):
     """201 Created
 
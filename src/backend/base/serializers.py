@@ -1,37 +1,246 @@
 from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.settings import api_settings
 from rest_framework.utils import html
 from rest_framework.fields import empty
 
 from django.db import models
-from django.db.models import query
-from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Prefetch, query
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist, ValidationError as DjangoValidationError
+
+
+class QueryPlan(object):
+    """
+    The `select_related`, `prefetch_related` and `only()` arguments needed to serialize
+    a queryset without per-row queries. `only` is None when the columns can't be restricted.
+    """
+
+    def __init__(self):
+        self.select_related = []
+        self.prefetch_related = []
+        self.only = []
+
+    def add_only(self, *paths):
+        if self.only is not None:
+            self.only.extend(paths)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        seen = set(lookup if isinstance(lookup, str) else lookup.prefetch_to
+                   for lookup in queryset._prefetch_related_lookups)
+        prefetch_related = [lookup for lookup in self.prefetch_related
+                            if (lookup if isinstance(lookup, str) else lookup.prefetch_to) not in seen]
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        # Leave columns alone if the caller already chose them
+        if self.only and queryset.query.deferred_loading == (frozenset(), True):
+            queryset = queryset.only(*self.only)
+        return queryset
+
+
+def plan_queryset(serializer, model):
+    """
+    Walks the readable fields of `serializer` (including embedded nested `ModelSerializer`s,
+    honouring the `embed` query params) and returns the `QueryPlan` for serializing `model` rows.
+    """
+    plan = QueryPlan()
+    _plan_fields(serializer, model, '', plan)
+    return plan
+
+
+def _plan_fields(serializer, model, prefix, plan):
+    meta = getattr(serializer, 'Meta', None)
+    select_related_fields = [prefix + name for name in getattr(meta, 'select_related_fields', [])]
+    if select_related_fields:
+        # Can't tell which columns of these relations are read
+        plan.select_related.extend(select_related_fields)
+        plan.only = None
+    plan.prefetch_related.extend(prefix + name for name in getattr(meta, 'prefetch_related_fields', []))
+    if type(serializer).to_representation not in (ModelSerializer.to_representation,
+                                                  serializers.ModelSerializer.to_representation):
+        # A custom representation may read any attribute
+        plan.only = None
+
+    for field in serializer._readable_fields:
+        source = field.source
+        if source == '*' or '.' in source:
+            plan.only = None
+            continue
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            # Properties and methods
+            plan.only = None
+            continue
+        path = prefix + source
+
+        if not model_field.is_relation:
+            plan.add_only(path)
+        elif model_field.related_model is None or (not model_field.concrete and not model_field.one_to_many
+                                                    and not model_field.many_to_many):
+            # Generic and reverse one-to-one relations
+            plan.only = None
+        elif model_field.many_to_many or model_field.one_to_many:
+            plan.prefetch_related.append(_plan_prefetch(field, model_field, path))
+        elif isinstance(field, ModelSerializer) and field.is_embeddable():
+            plan.select_related.append(path)
+            plan.add_only(path)
+            _plan_fields(field, model_field.related_model, path + '__', plan)
+        elif isinstance(field, ModelSerializer):
+            # Only the primary key of the related object is returned
+            plan.select_related.append(path)
+            plan.add_only(path, '%s__%s' % (path, model_field.related_model._meta.pk.name))
+        elif isinstance(field, PrimaryKeyRelatedField):
+            # Read from the foreign key column, no join needed
+            plan.add_only(path)
+        else:
+            plan.select_related.append(path)
+            plan.add_only(path)
+
+
+def _plan_prefetch(field, model_field, path):
+    related_model = model_field.related_model
+    child = getattr(field, 'child', None) if not isinstance(field, ManyRelatedField) else field.child_relation
+    nested = QueryPlan()
+    if isinstance(child, ModelSerializer) and child.is_embeddable():
+        _plan_fields(child, related_model, '', nested)
+    elif isinstance(child, (ModelSerializer, PrimaryKeyRelatedField)):
+        nested.add_only(related_model._meta.pk.name)
+    else:
+        nested.only = None
+    if model_field.one_to_many:
+        # The foreign key is needed to attach the prefetched rows to their parents
+        nested.add_only(model_field.field.name)
+    return Prefetch(path, queryset=nested.apply(related_model._default_manager.all()))
+
+
+def resolve_pks(queryset, values):
+    """
+    Fetch the rows of `queryset` for a list of primary key values with one query.
+    Values that are not valid primary keys are skipped here and reported per item later.
+    """
+    pk_field = queryset.model._meta.pk
+    pks = set()
+    for value in values:
+        try:
+            pks.add(pk_field.to_python(value))
+        except (DjangoValidationError, TypeError, ValueError):
+            continue
+    pks.discard(None)
+    return queryset.in_bulk(pks) if pks else {}
+
+
+def get_resolved(field, model, data):
+    """The instance for primary key `data` from `field.resolved_instances`, failing like a lookup would."""
+    try:
+        pk = model._meta.pk.to_python(data)
+    except (DjangoValidationError, TypeError, ValueError):
+        field.fail('incorrect_type', data_type=type(data).__name__)
+    if pk not in field.resolved_instances:
+        field.fail('does_not_exist', pk_value=data)
+    return field.resolved_instances[pk]
+
+
+def _group_by_queryset(targets):
+    """Groups fields reading the same unfiltered model queryset, so each model is fetched once."""
+    groups = {}
+    for field, queryset, values in targets:
+        key = queryset.model if not queryset.query.has_filters() else field
+        groups.setdefault(key, (queryset, []))[1].append((field, values))
+    return groups.values()
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """`PrimaryKeyRelatedField` that reads from instances prefetched by a parent `QuerySetSerializer`."""
+
+    def __init__(self, **kwargs):
+        self.resolved_instances = None
+        super(BulkPrimaryKeyRelatedField, self).__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if self.resolved_instances is None or self.pk_field is not None:
+            return super(BulkPrimaryKeyRelatedField, self).to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        return get_resolved(self, self.get_queryset().model, data)
 
 
 class QuerySetSerializer(serializers.ListSerializer):
-    def to_representation(self, data):
-        """
-        List of object instances -> List of dicts of primitive datatypes.
-        """
+    def prepare_queryset(self, data):
         # Dealing with nested relationships, data can be a Manager,
         # so, first get a queryset from the Manager if needed
         iterable = data.all() if isinstance(data, (models.Manager, query.QuerySet)) else data
 
-        # The queryset will be modified to add select_related for fields which need a separate query
-        # Such fields include:
-        # 1. Embeddable ForeignKey fields
-        # 2. Reverse foreign keys
-        # An inherited serializer can define a `select_related_fields` in the Meta class
-        if isinstance(data, query.QuerySet):
-            child = self.child
-            meta = getattr(child, 'Meta', None)
-            embeddable_fields = [fieldname for fieldname, field in child.fields.items() if isinstance(field, ModelSerializer) and field.is_embeddable()]
-            select_related_fields = getattr(meta, 'select_related_fields', [])
-            select_related_fields = embeddable_fields + list(select_related_fields)
-            iterable = iterable.select_related(*select_related_fields)
+        # The queryset will be planned (see `plan_queryset`) so that a list costs a constant number of queries:
+        # 1. Forward relations are joined with select_related
+        # 2. Reverse foreign keys and many-to-many relations are prefetched
+        # 3. Only the columns the serializer reads are loaded
+        # An inherited serializer can add `select_related_fields` / `prefetch_related_fields` in the Meta class
+        # Nested managers are not planned, their rows come from the parent's prefetch
+        if isinstance(data, query.QuerySet) and issubclass(data._iterable_class, query.ModelIterable):
+            iterable = plan_queryset(self.child, data.model).apply(iterable)
+        return iterable
+
+    def to_representation(self, data):
+        """
+        List of object instances -> List of dicts of primitive datatypes.
+        """
         return [
-            self.child.to_representation(item) for item in iterable
+            self.child.to_representation(item) for item in self.prepare_queryset(data)
         ]
 
+    def to_internal_value(self, data):
+        """
+        Primary keys referenced by the items are fetched before the items are validated one by one:
+        one `in_bulk` per related model, whether the child itself is a non-embedded `ModelSerializer`
+        (a list of pks) or has non-embedded `ModelSerializer` / primary key related fields.
+        """
+        if not isinstance(data, list):
+            return super(QuerySetSerializer, self).to_internal_value(data)
+        targets = self.get_resolvable_fields(data)
+        for queryset, group in _group_by_queryset(targets):
+            instances = resolve_pks(queryset, [value for field, values in group for value in values])
+            for field, values in group:
+                field.resolved_instances = instances
+        try:
+            return super(QuerySetSerializer, self).to_internal_value(data)
+        finally:
+            for field, queryset, values in targets:
+                field.resolved_instances = None
+
+    def get_resolvable_fields(self, data):
+        """`(field, queryset, referenced values)` of the fields that look up one related row by primary key."""
+        child = self.child
+        if isinstance(child, ModelSerializer) and not child.is_embeddable():
+            return [(child, child.Meta.model.objects.all(), data)]
+        if not isinstance(child, serializers.Serializer):
+            return []
+        targets = []
+        items = [item for item in data if isinstance(item, dict)]
+        for field in child._writable_fields:
+            if isinstance(field, ModelSerializer) and not field.is_embeddable():
+                queryset = field.Meta.model.objects.all()
+            elif isinstance(field, BulkPrimaryKeyRelatedField) and field.pk_field is None:
+                queryset = field.get_queryset()
+            else:
+                continue
+            values = [item[field.field_name] for item in items if item.get(field.field_name) is not None]
+            if values:
+                targets.append((field, queryset, values))
+        return targets
+
+    def iter_representation(self, data, chunk_size=2000):
+        """
+        Like `to_representation`, but yields one item at a time. Querysets are read
+        through a server-side cursor in chunks of `chunk_size` rows.
+        """
+        iterable = self.prepare_queryset(data)
+        if isinstance(iterable, query.QuerySet):
+            iterable = iterable.iterator(chunk_size=chunk_size)
+        for item in iterable:
+            yield self.child.to_representation(item)
+
 
 class ModelSerializer(serializers.ModelSerializer):
     """
@@ -41,12 +250,17 @@ class ModelSerializer(serializers.ModelSerializer):
     - If the `query_params` has an `embed` parameter with this field's name, then
     the resource will be embedded in the response
     """
+    serializer_related_field = BulkPrimaryKeyRelatedField
+
     def __init__(self, *args, **kwargs):
         # The default for ModelSerializer is to embed the values
         self.always_embed = kwargs.pop("always_embed", True)
+        # Instances prefetched by a parent QuerySetSerializer, keyed by primary key
+        self.resolved_instances = None
         super(ModelSerializer, self).__init__(*args, **kwargs)
         self.error_messages.update({
             'incorrect_type': 'Incorrect type. Expected id value, received {data_type}.',
+            'does_not_exist': 'Invalid pk "{pk_value}" - object does not exist.',
         })
 
     @classmethod
@@ -124,6 +338,9 @@ class ModelSerializer(serializers.ModelSerializer):
         # If the resource need not be embedded, then deserialize the value from a primitive value
         ModelClass = self.Meta.model
 
+        if self.resolved_instances is not None:
+            return get_resolved(self, ModelClass, data)
+
         # Assume the value to be a primary key
         try:
             return ModelClass.objects.get(pk=data)
@@ -142,6 +359,97 @@ class ModelSerializer(serializers.ModelSerializer):
         return instance.pk
 
 
+# Fields whose representation of a database value is the value itself
+_IDENTITY_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.FloatField, serializers.BooleanField)
+
+_fast_plans = {}
+
+
+class FastPlan(object):
+    """
+    Read-only shortcut for a serializer whose readable fields all map to model columns:
+    the queryset is projected with `values_list()` and each row is turned into the same dict
+    `to_representation` would build, without instantiating models or serializer machinery.
+    """
+
+    def __init__(self, names, paths, converters):
+        self.names = names
+        self.paths = paths
+        self.converters = converters
+
+    def project(self, queryset):
+        return queryset.values_list(*self.paths)
+
+    def to_representation(self, row):
+        if self.converters:
+            row = list(row)
+            for index, convert in self.converters:
+                if row[index] is not None:
+                    row[index] = convert(row[index])
+        return dict(zip(self.names, row))
+
+    def to_representations(self, rows):
+        names, converters = self.names, self.converters
+        if not converters:
+            return [dict(zip(names, row)) for row in rows]
+        return [self.to_representation(row) for row in rows]
+
+
+def _decimal_to_float(field):
+    def convert(value):
+        return float(field.to_representation(value))
+    return convert
+
+
+def _is_identity_field(field):
+    # Subclasses such as EmailField qualify only while they keep the inherited `to_representation`
+    return any(isinstance(field, identity) and type(field).to_representation is identity.to_representation
+               for identity in _IDENTITY_FIELDS)
+
+
+def get_fast_plan(serializer_class):
+    """
+    The `FastPlan` of `serializer_class`, compiled once per class, or None when one of its readable
+    fields needs the model instance (nested serializers, methods, properties, dotted sources...).
+    """
+    if serializer_class not in _fast_plans:
+        _fast_plans[serializer_class] = compile_fast_plan(serializer_class)
+    return _fast_plans[serializer_class]
+
+
+def compile_fast_plan(serializer_class):
+    serializer = serializer_class()
+    model = serializer.Meta.model
+    if type(serializer).to_representation not in (ModelSerializer.to_representation,
+                                                  serializers.ModelSerializer.to_representation):
+        return None
+    names, paths, converters = [], [], []
+    for field in serializer._readable_fields:
+        if field.source == '*' or '.' in field.source:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        if not model_field.concrete:
+            return None
+        if model_field.is_relation:
+            # Only the primary key of the related row is returned
+            if not isinstance(field, PrimaryKeyRelatedField) or field.pk_field is not None:
+                return None
+            paths.append(model_field.attname)
+        else:
+            paths.append(field.source)
+            if isinstance(field, serializers.DecimalField) and \
+                    not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING):
+                # Encoded as a float by the JSON renderers anyway, converted here so they don't call back
+                converters.append((len(paths) - 1, _decimal_to_float(field)))
+            elif not _is_identity_field(field):
+                converters.append((len(paths) - 1, field.to_representation))
+        names.append(field.field_name)
+    return FastPlan(names, paths, converters)
+
+
 class SawaggerResponseSerializer(serializers.Serializer):
    status = serializers.BooleanField(default=True)
    message = serializers.CharField()
@@ -1,4 +1,15 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
 import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import connections, models, transaction
+from django.db.models import signals
+from rest_framework import serializers
+
+from .serializers import plan_queryset
+from .utils.short_data import join_name
 
 
 def create_update_record(request, serializer_class, model_class):
@@ -15,32 +26,156 @@ def create_update_record(request, serializer_class, model_class):
 
 
 def create_update_bulk_records(request, serializer_class, model_class):
+    """
+    Validates every record, then writes all of them in one transaction, or none if any record is invalid.
+    Records with an `id` are partial updates of that row, the rest are created.
+
+    Rows to update are fetched with a single `in_bulk`. When the serializer and model use the stock
+    save path (see `can_bulk_write`) the rows are written with `bulk_create` / `bulk_update`,
+    otherwise `serializer.save()` is called for each record. Results are read back with one query.
+    """
     request_data = request.data.copy() if not type(request) == type(list()) else request
-    save_data, errors, raise_error = [], [], False
-    for record in request_data:
-        record = dict(record)
-        data_id = record.pop('id', None)
+    context = {"request": request} if not type(request) == type(list()) else {}
+    pending, errors, raise_error = build_bulk_serializers(request_data, serializer_class, model_class, context)
+    if raise_error:
+        return {"success": False, "errors": errors}
+
+    with transaction.atomic():
+        if can_bulk_write(pending, serializer_class, model_class):
+            saved = bulk_write(pending, model_class)
+        else:
+            saved = [serializer.save() for serializer in pending]
+    return {"success": True, "data": serialize_saved(saved, serializer_class, model_class, context)}
+
+
+def build_bulk_serializers(data, serializer_class, model_class, context=None):
+    """
+    Builds and validates one serializer per record, fetching the rows referenced by `id` with a single `in_bulk`.
+    Returns `(serializers, errors, raise_error)`, with a `None` serializer for records whose `id` doesn't exist.
+    """
+    context = context or {}
+    records = [dict(record) for record in data]
+    ids = [record.pop('id', None) for record in records]
+    pks = [to_pk(model_class, data_id) for data_id in ids]
+    instances = model_class.objects.in_bulk({pk for pk in pks if pk is not None}) if any(ids) else {}
+
+    pending, errors, raise_error = [], [], False
+    for record, data_id, pk in zip(records, ids, pks):
         if data_id:
-            data_obj = model_class.objects.get(id=data_id)
-            serializer = serializer_class(instance=data_obj, data=record, partial=True, context={"request": record})
+            data_obj = instances.get(pk)
+            if data_obj is None:
+                pending.append(None)
+                errors.append({'id': ['Invalid pk "%s" - object does not exist.' % data_id]})
+                raise_error = True
+                continue
+            serializer = serializer_class(instance=data_obj, data=record, partial=True, context=context)
         else:
-            serializer = serializer_class(data=record, context={"request": request})
-        validation = serializer.is_valid()
-        if validation:
-            save_data.append(serializer)
+            serializer = serializer_class(data=record, context=context)
+        if serializer.is_valid():
             errors.append({})
         else:
-            save_data.append({})
             errors.append(serializer.errors)
             raise_error = True
-    if raise_error:
-        return {"success": False, "errors": errors}
+        pending.append(serializer)
+    return pending, errors, raise_error
+
+
+def validate_bulk_records(data, serializer_class, model_class, context=None, processes=None):
+    """
+    Dry run of `create_update_bulk_records`: validates every record once and collects the errors, nothing is saved.
+
+    With `processes` > 1 (default `settings.BULK_VALIDATION_PROCESSES`) and at least
+    `settings.BULK_VALIDATION_PROCESS_THRESHOLD` records, the records are validated in chunks by a
+    process pool. Only worth it for CPU-heavy serializers; the request can't be sent to the workers,
+    so the pool is skipped when a `context` is given.
+    """
+    data = list(data)
+    processes = settings.BULK_VALIDATION_PROCESSES if processes is None else processes
+    if processes > 1 and not context and len(data) >= settings.BULK_VALIDATION_PROCESS_THRESHOLD:
+        errors = validate_in_processes(data, serializer_class, model_class, processes)
+        raise_error = any(errors)
     else:
-        saved_data = []
-        for record in save_data:
-            update_object = record.save()
-            saved_data.append(serializer_class(instance=update_object).data)
-        return {"success": True, "data": saved_data}
+        _, errors, raise_error = build_bulk_serializers(data, serializer_class, model_class, context)
+    return {"success": False, "errors": errors} if raise_error else {"success": True}
+
+
+def validate_in_processes(data, serializer_class, model_class, processes):
+    chunk_size = -(-len(data) // processes)
+    chunks = [data[start:start + chunk_size] for start in range(0, len(data), chunk_size)]
+    # Forked workers must not share the parent's database sockets
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = executor.map(_validate_chunk, chunks, repeat(serializer_class), repeat(model_class))
+        return [error for chunk_errors in results for error in chunk_errors]
+
+
+def _validate_chunk(chunk, serializer_class, model_class):
+    _, errors, _ = build_bulk_serializers(chunk, serializer_class, model_class)
+    return errors
+
+
+def to_pk(model_class, value):
+    if not value:
+        return None
+    try:
+        return model_class._meta.pk.to_python(value)
+    except (DjangoValidationError, TypeError, ValueError):
+        return None
+
+
+def can_bulk_write(pending, serializer_class, model_class):
+    """
+    `bulk_create` / `bulk_update` skip `save()`, signals and many-to-many assignment,
+    so they are only used when none of them would do anything.
+    """
+    if serializer_class.create is not serializers.ModelSerializer.create or \
+            serializer_class.update is not serializers.ModelSerializer.update:
+        return False
+    if model_class.save is not models.Model.save:
+        return False
+    if any(signal.has_listeners(model_class) for signal in (signals.pre_save, signals.post_save)):
+        return False
+    many_to_many = {field.name for field in model_class._meta.many_to_many}
+    return not any(many_to_many.intersection(serializer.validated_data) for serializer in pending)
+
+
+def bulk_write(pending, model_class):
+    batch_size = settings.BULK_WRITE_BATCH_SIZE
+    saved, created, updated, update_fields = [], [], {}, set()
+    for serializer in pending:
+        if serializer.instance is None:
+            instance = model_class(**serializer.validated_data)
+            created.append(instance)
+        else:
+            instance = serializer.instance
+            for attr, value in serializer.validated_data.items():
+                setattr(instance, attr, value)
+            update_fields.update(serializer.validated_data)
+            updated[instance.pk] = instance
+        saved.append(instance)
+    if created:
+        model_class.objects.bulk_create(created, batch_size=batch_size)
+    if updated:
+        # bulk_update doesn't call pre_save, so `auto_now` fields are refreshed here
+        for field in model_class._meta.concrete_fields:
+            if getattr(field, 'auto_now', False):
+                update_fields.add(field.name)
+                for instance in updated.values():
+                    field.pre_save(instance, False)
+        if update_fields:
+            model_class.objects.bulk_update(list(updated.values()), update_fields, batch_size=batch_size)
+    return saved
+
+
+def serialize_saved(saved, serializer_class, model_class, context):
+    serializer = serializer_class(context=context)
+    pks = [instance.pk for instance in saved]
+    if None in pks:
+        # The database backend doesn't return primary keys from bulk inserts
+        return [serializer.to_representation(instance) for instance in saved]
+    queryset = plan_queryset(serializer, model_class).apply(model_class.objects.filter(pk__in=pks))
+    fetched = {instance.pk: instance for instance in queryset}
+    return [serializer.to_representation(fetched[pk]) for pk in pks]
 
 
 def validate_serializer_data(record, serializer_class, model_class):
@@ -54,22 +189,7 @@ def validate_serializer_data(record, serializer_class, model_class):
 
 
 def validate_serializer_multiple(data, serializer_class, model_class):
-    errors, raise_error = [], False
-    for record in data:
-        record = dict(record)
-        data_id = record.pop('id', None)
-        if data_id:
-            data_obj = model_class.objects.get(id=data_id)
-            serializer = serializer_class(instance=data_obj, data=record, partial=True)
-        else:
-            serializer = serializer_class(data=record)
-        validation = validate_serializer_data(record, serializer_class, model_class)
-        if validation:
-            errors.append({})
-        else:
-            errors.append(serializer.errors)
-            raise_error = True
-    return {"success": False, "errors": errors} if raise_error else {"success": True}
+    return validate_bulk_records(data, serializer_class, model_class)
 
 
 def get_status(item):
@@ -81,28 +201,26 @@ def get_status(item):
 
 
 def get_full_name(user):
-    if user and user.middle_name:
-        return user.first_name + " " + user.middle_name + " " + user.last_name
-    elif user:
-        return user.first_name + " " + user.last_name
-    return ""
+    if not user:
+        return ""
+    return getattr(user, 'full_name', None) or join_name(user.first_name, user.middle_name, user.last_name)
 
 
 def get_full_name_dict(user_dict):
-    if user_dict and "middle_name" in user_dict and user_dict["middle_name"]:
-        return user_dict["first_name"] + " " + user_dict["middle_name"] + " " + user_dict["last_name"]
-    elif user_dict:
-        return user_dict["first_name"] + " " + user_dict["last_name"]
-    return "--"
+    """Full name from a user `values()` dict, preferring its precomputed `full_name`."""
+    if not user_dict:
+        return "--"
+    return user_dict.get("full_name") or join_name(
+        user_dict.get("first_name"), user_dict.get("middle_name"), user_dict.get("last_name"))
 
 
 def get_full_name_code_dict(user_dict):
-    if user_dict and "middle_name" in user_dict and user_dict["middle_name"]:
-        return "(" + user_dict["employee_code_data"] + ") " + user_dict["first_name"] + " " + user_dict[
-            "middle_name"] + " " + user_dict["last_name"]
-    elif user_dict:
-        return "(" + user_dict["employee_code_data"] + ") " + user_dict["first_name"] + " " + user_dict["last_name"]
-    return "--"
+    """Like `get_full_name_dict`, prefixed with "(<employee code>) " when the dict has one."""
+    if not user_dict:
+        return "--"
+    code = user_dict.get("employee_code_data") or user_dict.get("username")
+    full_name = get_full_name_dict(user_dict)
+    return "(%s) %s" % (code, full_name) if code else full_name
 
 
 def get_clean_date(date):
@@ -1,3 +1,625 @@
-from django.test import TestCase
+import json
+import logging
+import smtplib
+import sys
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from ..slack_logger import SlackExceptionHandler
+
+from .api import permissions
+from .api.pagination import KeysetPagination, StandardResultsSetPagination
+from .api.renderers import FastJSONRenderer
+from .api.viewsets import ModelViewSet
+from .cache import Namespace
+from .models import SMSOutbox
+from .services import create_update_bulk_records, validate_bulk_records
+from .serializers import ModelSerializer, get_fast_plan, plan_queryset
+from .utils import email, sms
+from .utils.dispatch import QueueDispatcher
+
+
+class FlakySMSBackend(sms.FakeSMSBackend):
+    """Fails the first `failures` sends."""
+
+    def __init__(self, failures):
+        self.failures = failures
+
+    def send(self, phone_no, body):
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError('gateway down')
+        super(FlakySMSBackend, self).send(phone_no, body)
+
+
+@override_settings(SMS_DISPATCH_WORKERS=0, SMS_DISPATCH_MAX_RETRIES=2, SMS_DISPATCH_RETRY_BACKOFF=0.5,
+                   SMS_OUTBOX_GRACE_SECONDS=300)
+class SMSOutboxTests(TestCase):
+
+    def setUp(self):
+        sms.FakeSMSBackend.outbox = []
+        self.backend = sms.FakeSMSBackend()
+        for name, value in (('_backend', self.backend), ('_dispatcher', None)):
+            patcher = mock.patch.object(sms, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        sleep = mock.patch('backend.base.utils.dispatch.time.sleep')
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def age(self, message, seconds=600, **fields):
+        SMSOutbox.objects.filter(pk=message.pk).update(created_at=timezone.now() - timedelta(seconds=seconds),
+                                                       modified_at=timezone.now() - timedelta(seconds=seconds),
+                                                       **fields)
+
+    def test_enqueue_sends_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            message = sms.enqueue_sms(9000000001, 'hello')
+        self.assertEqual(SMSOutbox.objects.get(pk=message.pk).status, SMSOutbox.PENDING)
+        self.assertEqual(sms.FakeSMSBackend.outbox, [])
+
+        for callback in callbacks:
+            callback()
+        message.refresh_from_db()
+        self.assertEqual(message.status, SMSOutbox.SENT)
+        self.assertEqual(message.attempts, 1)
+        self.assertIsNotNone(message.sent_at)
+        self.assertEqual(message.body, '')
+        self.assertEqual(sms.FakeSMSBackend.outbox, [{'phone_no': '9000000001', 'body': 'hello'}])
+
+    def test_retry_with_backoff(self):
+        sms._backend = FlakySMSBackend(failures=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            message = sms.enqueue_sms('9000000001', 'hello')
+        message.refresh_from_db()
+        self.assertEqual(message.status, SMSOutbox.SENT)
+        self.assertEqual(message.attempts, 3)
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [0.5, 1.0])
+
+    def test_gives_up_after_max_retries(self):
+        sms._backend = FlakySMSBackend(failures=5)
+        with self.assertLogs('backend.base.utils.dispatch', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+            message = sms.enqueue_sms('9000000001', 'hello')
+        message.refresh_from_db()
+        self.assertEqual(message.status, SMSOutbox.FAILED)
+        self.assertEqual(message.attempts, 3)
+        self.assertEqual(message.last_error, 'gateway down')
+        self.assertEqual(message.body, '')
+        self.assertEqual(sms.FakeSMSBackend.outbox, [])
+
+    def test_flush_outbox_sends_stale_rows_once(self):
+        old = SMSOutbox.objects.create(mobile='9000000001', body='old')
+        self.age(old)
+        recent = SMSOutbox.objects.create(mobile='9000000002', body='recent')
+        abandoned = SMSOutbox.objects.create(mobile='9000000003', body='abandoned')
+        self.age(abandoned, status=SMSOutbox.SENDING)
+        in_flight = SMSOutbox.objects.create(mobile='9000000004', body='in flight')
+        self.age(in_flight, status=SMSOutbox.SENDING)
+        SMSOutbox.objects.filter(pk=in_flight.pk).update(modified_at=timezone.now())
+
+        sms.flush_outbox()
+        sms.flush_outbox()
+
+        self.assertEqual(sorted(message['body'] for message in sms.FakeSMSBackend.outbox), ['abandoned', 'old'])
+        statuses = dict(SMSOutbox.objects.values_list('mobile', 'status'))
+        self.assertEqual(statuses, {'9000000001': SMSOutbox.SENT, '9000000002': SMSOutbox.PENDING,
+                                    '9000000003': SMSOutbox.SENT, '9000000004': SMSOutbox.SENDING})
+        bodies = dict(SMSOutbox.objects.values_list('mobile', 'body'))
+        self.assertEqual(bodies, {'9000000001': '', '9000000002': 'recent', '9000000003': '',
+                                  '9000000004': 'in flight'})
+        self.assertEqual(SMSOutbox.objects.get(pk=recent.pk).attempts, 0)
+
+    def test_rows_are_claimed_once(self):
+        message = SMSOutbox.objects.create(mobile='9000000001', body='hello')
+        self.age(message)
+        item = (message.pk, message.mobile, message.body)
+        cutoff = timezone.now() - timedelta(seconds=300)
+        self.assertTrue(sms._claim_stale(item, cutoff))
+        # An overlapping cron run and the in-process dispatcher both lose the claim
+        self.assertFalse(sms._claim_stale(item, cutoff))
+        self.assertFalse(sms._claim(item))
+
+    def test_dispatcher_skips_rows_flushed_by_cron(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            message = sms.enqueue_sms('9000000001', 'hello')
+        self.age(message)
+        sms.flush_outbox()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(sms.FakeSMSBackend.outbox), 1)
+        self.assertEqual(SMSOutbox.objects.get(pk=message.pk).attempts, 1)
+
+
+class QueueDispatcherTests(TestCase):
+
+    def test_claim_is_checked_once(self):
+        handled, claims = [], []
+        attempts = iter([RuntimeError('down'), None])
+
+        def handler(item):
+            error = next(attempts)
+            if error:
+                raise error
+            handled.append(item)
+
+        dispatcher = QueueDispatcher(handler, workers=0, max_retries=1, backoff=0,
+                                     claim=lambda item: claims.append(item) or True)
+        self.assertTrue(dispatcher.submit('item'))
+        self.assertEqual(handled, ['item'])
+        self.assertEqual(claims, ['item'])
+
+    def test_unclaimed_item_is_skipped(self):
+        handled = []
+        dispatcher = QueueDispatcher(handled.append, workers=0, claim=lambda item: False)
+        dispatcher.submit('item')
+        self.assertEqual(handled, [])
+
+
+class UserReferenceSerializer(ModelSerializer):
+    class Meta:
+        model = get_user_model()
+        fields = ('id',)
+
+
+class OutboxSerializer(ModelSerializer):
+    class Meta:
+        model = SMSOutbox
+        fields = ('mobile', 'body', 'created_by')
+
+
+class NestedOutboxSerializer(ModelSerializer):
+    created_by = UserReferenceSerializer(always_embed=False)
+
+    class Meta:
+        model = SMSOutbox
+        fields = ('mobile', 'body', 'created_by')
+
+
+class ResolveRelatedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [get_user_model().objects.create_user('User', str(number), '90000000%02d' % number,
+                                                          'user%s@example.com' % number)
+                     for number in range(5)]
+
+    def setUp(self):
+        self.context = {'request': Request(APIRequestFactory().get('/'))}
+
+    def records(self):
+        return [{'mobile': user.mobile, 'body': 'hello', 'created_by': user.pk} for user in self.users]
+
+    def test_primary_key_related_fields_are_fetched_once(self):
+        serializer = OutboxSerializer(data=self.records(), many=True, context=self.context)
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual([item['created_by'] for item in serializer.validated_data], self.users)
+
+    def test_nested_model_serializer_fields_are_fetched_once(self):
+        serializer = NestedOutboxSerializer(data=self.records(), many=True, context=self.context)
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual([item['created_by'] for item in serializer.validated_data], self.users)
+
+    def test_pk_list_is_fetched_once(self):
+        serializer = UserReferenceSerializer(data=[user.pk for user in self.users], many=True, always_embed=False,
+                                             context=self.context)
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data, self.users)
+
+    def test_invalid_references_are_reported_per_item(self):
+        records = self.records()
+        records[1]['created_by'] = 10 ** 6
+        records[2]['created_by'] = 'abc'
+        records[3]['created_by'] = True
+        serializer = OutboxSerializer(data=records, many=True, context=self.context)
+        with self.assertNumQueries(1):
+            self.assertFalse(serializer.is_valid())
+        errors = serializer.errors
+        self.assertEqual(errors[0], {})
+        self.assertEqual(errors[1]['created_by'][0].code, 'does_not_exist')
+        self.assertEqual(errors[2]['created_by'][0].code, 'incorrect_type')
+        self.assertEqual(errors[3]['created_by'][0].code, 'incorrect_type')
+        self.assertEqual(errors[4], {})
+
+    def test_single_item_still_validates(self):
+        serializer = OutboxSerializer(data=self.records()[0], context=self.context)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertEqual(serializer.validated_data['created_by'], self.users[0])
+
+
+class OutboxStatusSerializer(ModelSerializer):
+    class Meta:
+        model = SMSOutbox
+        fields = ('id', 'mobile', 'body', 'status')
+
+
+class BulkRecordsMixin(object):
+    """Records shared by the bulk write and bulk validation tests."""
+
+    def setUp(self):
+        self.message = SMSOutbox.objects.create(mobile='9000000001', body='hello')
+
+    def records(self):
+        return [
+            {'id': self.message.pk, 'body': 'updated'},
+            {'mobile': '9000000002', 'body': 'new'},
+        ]
+
+    def invalid_records(self):
+        return self.records() + [{'mobile': '9000000003', 'body': 'bad', 'status': 'unknown'},
+                                 {'id': 10 ** 6, 'body': 'missing'}, {'id': 'abc', 'body': 'missing'}]
+
+    def assertErrorContract(self, result, records):
+        self.assertEqual(set(result), {'success', 'errors'})
+        self.assertFalse(result['success'])
+        errors = result['errors']
+        self.assertEqual(len(errors), len(records))
+        self.assertEqual(errors[:2], [{}, {}])
+        self.assertIn('status', errors[2])
+        self.assertEqual(errors[3], {'id': ['Invalid pk "%s" - object does not exist.' % 10 ** 6]})
+        self.assertEqual(errors[4], {'id': ['Invalid pk "abc" - object does not exist.']})
+        self.assertEqual(SMSOutbox.objects.count(), 1)
+        self.assertEqual(SMSOutbox.objects.get().body, 'hello')
+
+
+class BulkRecordsTests(BulkRecordsMixin, TestCase):
+
+    def test_valid_records_are_saved_in_order(self):
+        result = create_update_bulk_records(self.records(), OutboxStatusSerializer, SMSOutbox)
+        self.assertTrue(result['success'])
+        self.assertEqual([item['body'] for item in result['data']], ['updated', 'new'])
+        self.assertEqual(result['data'][0]['id'], self.message.pk)
+        self.assertEqual(result['data'][0]['mobile'], '9000000001')
+        self.assertEqual(SMSOutbox.objects.count(), 2)
+
+    def test_errors_are_reported_per_record_and_nothing_is_saved(self):
+        records = self.invalid_records()
+        self.assertErrorContract(create_update_bulk_records(records, OutboxStatusSerializer, SMSOutbox), records)
+
+    def test_records_are_not_modified(self):
+        records = self.records()
+        create_update_bulk_records(records, OutboxStatusSerializer, SMSOutbox)
+        self.assertEqual(records, self.records())
+
+
+class ValidateBulkRecordsTests(BulkRecordsMixin, TestCase):
+
+    def test_errors_match_create_update(self):
+        records = self.invalid_records()
+        self.assertErrorContract(validate_bulk_records(records, OutboxStatusSerializer, SMSOutbox, processes=1),
+                                 records)
+
+    def test_validate_only(self):
+        self.assertEqual(validate_bulk_records(self.records(), OutboxStatusSerializer, SMSOutbox, processes=1),
+                         {'success': True})
+        self.assertEqual(SMSOutbox.objects.get().body, 'hello')
+
+
+class DecimalOutboxSerializer(ModelSerializer):
+    attempts = serializers.DecimalField(max_digits=6, decimal_places=2, coerce_to_string=False)
+
+    class Meta:
+        model = SMSOutbox
+        fields = ('mobile', 'attempts')
+
+
+class DecimalRenderingTests(TestCase):
+
+    def test_decimals_render_like_drf(self):
+        data = [{'amount': Decimal('12.50'), 'rate': Decimal('-0.125'), 'total': None}, {'when': timedelta(0)}]
+        self.assertEqual(json.loads(FastJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+
+    def test_fast_plan_converts_decimals(self):
+        SMSOutbox.objects.create(mobile='9000000001', body='hello', attempts=3)
+        queryset = SMSOutbox.objects.all()
+        plan = get_fast_plan(DecimalOutboxSerializer)
+        self.assertIsNotNone(plan)
+        rows = plan.to_representations(plan.project(queryset))
+        self.assertEqual(rows, [{'mobile': '9000000001', 'attempts': 3.0}])
+        self.assertEqual(FastJSONRenderer().render(rows),
+                         FastJSONRenderer().render(DecimalOutboxSerializer(queryset, many=True).data))
+
+
+@override_settings(DEBUG=False, SLACK_WEBHOOK_URL='https://hooks.example.com/test')
+class SlackExceptionHandlerTests(TestCase):
+
+    def setUp(self):
+        self.handler = SlackExceptionHandler()
+        # Keep the payloads on the queue instead of starting the sender thread
+        self.handler._ensure_sender = lambda: None
+
+    def error_record(self):
+        request = APIRequestFactory().get('/fh-api/v1/users/', {'page': 1})
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.LogRecord('django.request', logging.ERROR, __file__, 1, 'Internal Server Error',
+                                       None, sys.exc_info())
+        record.request = request
+        return record
+
+    def test_report_is_rendered_before_queueing(self):
+        self.handler.emit(self.error_record())
+        record, data = self.handler.queue.get_nowait()
+        payload = json.loads(data['payload'])
+        fields = {field['title']: field['value'] for field in payload['attachments'][0]['fields']}
+        self.assertEqual(fields['Path'], '/fh-api/v1/users/')
+        self.assertEqual(fields['User'], 'Anonymous')
+        self.assertIn("Exception Value: boom", payload['attachments'][1]['text'])
+
+        with mock.patch('backend.slack_logger.requests.post') as post:
+            self.handler.post(data)
+        post.assert_called_once_with('https://hooks.example.com/test', data=data, timeout=5)
+
+    def test_repeats_are_coalesced(self):
+        record = self.error_record()
+        self.handler.emit(record)
+        self.handler.emit(record)
+        self.assertEqual(self.handler.queue.qsize(), 1)
+
+
+class NamespaceTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.namespace = Namespace('tests', timeout=60)
+        self.namespace.get_version(refresh=True)
+
+    def test_reads_and_writes_are_one_round_trip(self):
+        with mock.patch.object(cache, 'get', wraps=cache.get) as get, \
+                mock.patch.object(cache, 'set', wraps=cache.set) as set_:
+            self.namespace.set('key', 'value')
+            self.assertEqual(self.namespace.get('key'), 'value')
+            self.assertEqual(self.namespace.get_or_set('key', lambda: 'other'), 'value')
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(set_.call_count, 1)
+
+    def test_invalidate_is_seen_at_once_in_process(self):
+        self.namespace.set('key', 'value')
+        Namespace('tests').invalidate()
+        self.assertIsNone(self.namespace.get('key'))
+
+    def test_invalidate_from_another_process_is_seen_after_the_ttl(self):
+        self.namespace.set('key', 'value')
+        # Another process bumps the version in the shared cache
+        cache.incr(self.namespace.version_key)
+        self.assertEqual(self.namespace.get('key'), 'value')
+        with mock.patch('backend.base.cache.time.monotonic', return_value=time.monotonic() + 60):
+            self.assertIsNone(self.namespace.get('key'))
+
+    def test_delete_covers_a_bumped_version(self):
+        self.namespace.set('key', 'stale')
+        cache.incr(self.namespace.version_key)
+        cache.set('tests:2:key', 'fresh')
+        self.assertTrue(self.namespace.delete('key'))
+        self.assertIsNone(cache.get('tests:1:key'))
+        self.assertIsNone(cache.get('tests:2:key'))
+        self.assertFalse(self.namespace.delete('key'))
+
+
+class RequestUser(object):
+
+    def __init__(self, is_authenticated=True, is_superuser=False):
+        self.pk = 1 if is_authenticated else None
+        self.is_authenticated = is_authenticated
+        self.is_superuser = is_superuser
+
+
+class Owned(object):
+
+    def __init__(self, owner):
+        self.owner = owner
+
+
+class NestedPermissions(permissions.ResourcePermission):
+    enough_perms = permissions.IsSuperUser()
+    global_perms = permissions.Not(permissions.DenyAll())
+    list_perms = [permissions.IsAuthenticated(), permissions.AllOnlyGetPerm() | permissions.AllowAnyPostPerm()]
+    retrieve_perms = (permissions.IsAuthenticated() & (permissions.AllowAny() & permissions.IsObjectOwner())) | \
+        (permissions.HasMandatoryParam('token') & ~permissions.AllowAnyPostPerm())
+    create_perms = permissions.AllowAnyPostPerm() | permissions.AllowAny() | permissions.DenyAll()
+    update_perms = permissions.IsObjectOwner
+    destroy_perms = permissions.DenyAll() & (permissions.AllowAny() | permissions.IsAuthenticated())
+
+
+class PlainPermissions(permissions.ResourcePermission):
+    list_perms = permissions.And(permissions.And(), permissions.Or(permissions.AllOnlyGetPerm()))
+
+
+class PermissionPlanTests(TestCase):
+
+    def requests(self):
+        factory = APIRequestFactory()
+        users = [RequestUser(is_authenticated=False), RequestUser(), RequestUser(is_superuser=True)]
+        for user in users:
+            for request in (factory.get('/'), factory.get('/', {'token': 'x'}), factory.post('/')):
+                request.user = user
+                yield request
+
+    def test_plans_match_rebuilt_permsets(self):
+        actions = ('list', 'retrieve', 'create', 'update', 'partial_update', 'destroy')
+        for permission_class in (NestedPermissions, PlainPermissions):
+            permission = permission_class()
+            for action in actions:
+                permset, plan = permission.build_permset(action), permission.get_permission_plan(action)
+                for request in self.requests():
+                    self.assertEqual(bool(plan.has_permission(request, None)),
+                                     bool(permset.has_permission(request, None)), (permission_class, action))
+                    for obj in (Owned(request.user), Owned(None)):
+                        self.assertEqual(bool(plan.has_object_permission(request, None, obj)),
+                                         bool(permset.has_object_permission(request, None, obj)),
+                                         (permission_class, action))
+
+    def test_plans_are_flattened_and_cached(self):
+        permission = NestedPermissions()
+        plan = permission.get_permission_plan('list')
+        self.assertIs(NestedPermissions().get_permission_plan('list'), plan)
+        self.assertIsInstance(plan, permissions.Or)
+        self.assertIsInstance(plan.components[1], permissions.And)
+        self.assertFalse(any(isinstance(component, permissions.And) for component in plan.components[1].components))
+        # The AllowAny decides the inner Or, which is then a no-op in the global And
+        self.assertEqual([type(component) for component in permission.get_permission_plan('create').components],
+                         [permissions.IsSuperUser, permissions.Not])
+        self.assertIsInstance(PlainPermissions().get_permission_plan('list'), permissions.AllOnlyGetPerm)
+        self.assertIsInstance(PlainPermissions().get_permission_plan('retrieve'), permissions.AllowAny)
+
+
+class OutboxCreatorSerializer(ModelSerializer):
+    created_by = UserReferenceSerializer()
+
+    class Meta:
+        model = SMSOutbox
+        fields = ('id', 'mobile', 'created_by')
+
+
+class OutboxPermissions(permissions.ResourcePermission):
+    list_perms = permissions.AllowAny()
+
+
+class OutboxViewSet(ModelViewSet):
+    queryset = SMSOutbox.objects.all()
+    serializer_class = OutboxCreatorSerializer
+    permission_classes = (OutboxPermissions,)
+    pagination_class = StandardResultsSetPagination
+    keyset_pagination_class = KeysetPagination
+
+
+class QueryPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(5):
+            user = get_user_model().objects.create_user('User', str(number), '90000000%02d' % number,
+                                                        'user%s@example.com' % number)
+            SMSOutbox.objects.create(mobile=user.mobile, body='hello', created_by=user)
+
+    def list(self, **params):
+        request = APIRequestFactory().get('/', params)
+        res = OutboxViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(res.status_code, 200)
+        if res.streaming:
+            return json.loads(b''.join(res.streaming_content))
+        return res.data
+
+    def test_plan(self):
+        plan = plan_queryset(OutboxCreatorSerializer(), SMSOutbox)
+        self.assertEqual(plan.select_related, ['created_by'])
+        self.assertEqual(plan.prefetch_related, [])
+        self.assertEqual(sorted(plan.only), ['created_by', 'created_by__id', 'id', 'mobile'])
+
+    def test_unpaginated_list(self):
+        with self.assertNumQueries(1):
+            data = self.list(pagination='false')
+        self.assertEqual(len(data), 5)
+
+    def test_paginated_list(self):
+        # The count and the page
+        with self.assertNumQueries(2):
+            data = self.list(page_size=3)
+        self.assertEqual(len(data['results']), 3)
+        self.assertEqual(data['results'][0]['created_by'], {'id': data['results'][0]['created_by']['id']})
+
+    def test_keyset_list(self):
+        with self.assertNumQueries(1):
+            data = self.list(cursor='', page_size=2)
+        with self.assertNumQueries(1):
+            data = self.list(cursor=data['next'], page_size=2)
+        self.assertEqual(len(data['results']), 2)
+
+
+class CountingEmailBackend(LocmemEmailBackend):
+    """Locmem backend counting its instances and failing the first `failures` sends."""
+    instances = 0
+    failures = 0
+
+    def __init__(self, *args, **kwargs):
+        super(CountingEmailBackend, self).__init__(*args, **kwargs)
+        CountingEmailBackend.instances += 1
+
+    def send_messages(self, messages):
+        if CountingEmailBackend.failures > 0:
+            CountingEmailBackend.failures -= 1
+            raise smtplib.SMTPServerDisconnected('connection lost')
+        return super(CountingEmailBackend, self).send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='backend.base.tests.CountingEmailBackend')
+class MailDispatcherTests(TestCase):
+
+    def setUp(self):
+        CountingEmailBackend.instances = CountingEmailBackend.failures = 0
+
+    def message(self, number=0):
+        return EmailMessage('Subject %s' % number, 'Body', 'from@example.com', ['to@example.com'])
+
+    def test_one_connection_per_batch(self):
+        dispatcher = email.MailDispatcher(batch_size=10, workers=1, backoff=0)
+        deliveries = [email.Delivery(self.message(number)) for number in range(5)]
+        # Queued before the worker starts, so they are picked up as one batch
+        for delivery in deliveries:
+            dispatcher.queue.put_nowait(delivery)
+        dispatcher._ensure_workers()
+        dispatcher.queue.join()
+        self.assertEqual([delivery.wait(1) for delivery in deliveries], [email.Delivery.SENT] * 5)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(CountingEmailBackend.instances, 1)
+
+    def test_reconnects_after_a_failure(self):
+        CountingEmailBackend.failures = 1
+        dispatcher = email.MailDispatcher(workers=0, max_retries=2, backoff=0)
+        delivery = email.Delivery(self.message())
+        self.assertTrue(dispatcher.submit(delivery))
+        self.assertEqual(delivery.status, email.Delivery.SENT)
+        self.assertEqual(delivery.attempts, 2)
+        self.assertEqual(CountingEmailBackend.instances, 2)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_delivery_status(self):
+        CountingEmailBackend.failures = 3
+        dispatcher = email.MailDispatcher(workers=0, max_retries=2, backoff=0)
+        delivery = email.Delivery(self.message())
+        self.assertEqual(delivery.status, email.Delivery.QUEUED)
+        self.assertTrue(delivery)
+        with self.assertLogs('backend.base.utils.dispatch', 'ERROR'):
+            dispatcher.submit(delivery)
+        self.assertEqual(delivery.wait(0), email.Delivery.FAILED)
+        self.assertEqual(delivery.attempts, 3)
+        self.assertIn('connection lost', delivery.error)
+        self.assertFalse(delivery)
+        self.assertEqual(mail.outbox, [])
+
+    def test_full_queue_sends_inline(self):
+        dispatcher = email.MailDispatcher(workers=1, queue_size=1, backoff=0)
+        # No worker draining the queue
+        dispatcher._threads = [None]
+        dispatcher.queue.put_nowait(email.Delivery(self.message()))
+        with mock.patch.object(email, 'get_dispatcher', return_value=dispatcher):
+            delivery = email.enqueue(self.message(1))
+        self.assertEqual(delivery.status, email.Delivery.SENT)
+        self.assertEqual([message.subject for message in mail.outbox], ['Subject 1'])
+        self.assertEqual(dispatcher.queue.qsize(), 1)
+
+    def test_send_stays_truthy(self):
+        dispatcher = email.MailDispatcher(workers=0, backoff=0)
+        with mock.patch.object(email, 'get_dispatcher', return_value=dispatcher):
+            self.assertTrue(email.send('to@example.com', 'Hello', '<p>Hi</p>'))
+            CountingEmailBackend.failures = 10
+            with self.assertLogs('backend.base.utils.dispatch', 'ERROR'):
+                self.assertFalse(email.send('to@example.com', 'Hello', '<p>Hi</p>'))
+        self.assertEqual(mail.outbox[0].body, 'Hi')
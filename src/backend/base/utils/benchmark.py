@@ -0,0 +1,11 @@
+import time
+
+
+def best(repeat, func):
+    """Fastest of `repeat` timed calls to `func`, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
@@ -0,0 +1,92 @@
+"""
+Small in-process job dispatcher used for outbound side effects (SMS, mail) that should not block a request.
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueueDispatcher(object):
+    """
+    Bounded queue drained by a pool of daemon worker threads.
+
+    `handler(item)` is called for every submitted item and retried with exponential backoff when it raises.
+    `on_success(item, attempts)` / `on_failure(item, attempts, exc)` are called once the item is settled.
+    `claim(item)` is called once before the first attempt; items it returns False for are skipped.
+    With `workers=0` items are handled synchronously inside `submit`, which is what tests want.
+    """
+
+    def __init__(self, handler, workers=2, queue_size=1000, max_retries=3, backoff=1.0, name='dispatcher',
+                 on_success=None, on_failure=None, claim=None):
+        self.handler = handler
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.name = name
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.claim = claim
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        """
+        Queue an item for delivery. Returns False when the queue is full and the item was not accepted.
+        """
+        if self.workers <= 0:
+            self.process(item)
+            return True
+        self._ensure_workers()
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            logger.warning("%s queue is full, dropping item from the in-process queue.", self.name)
+            return False
+        return True
+
+    def process(self, item):
+        if self.claim and not self.claim(item):
+            return False
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                self.handler(item)
+            except Exception as exc:
+                if attempts > self.max_retries:
+                    logger.exception("%s gave up after %s attempts.", self.name, attempts)
+                    if self.on_failure:
+                        self.on_failure(item, attempts, exc)
+                    return False
+                time.sleep(self.backoff * (2 ** (attempts - 1)))
+            else:
+                if self.on_success:
+                    self.on_success(item, attempts)
+                return True
+
+    def _ensure_workers(self):
+        if len(self._threads) >= self.workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name='%s-%s' % (self.name, len(self._threads)),
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                self.process(item)
+            except Exception:
+                logger.exception("%s failed to settle an item.", self.name)
+            finally:
+                close_old_connections()
+                self.queue.task_done()
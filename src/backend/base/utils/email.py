@@ -1,16 +1,166 @@
 import logging
 import os
 import os.path
+import queue
+import threading
 
 # Sending Email
-from django.core.mail import EmailMultiAlternatives
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import close_old_connections
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 
+from .dispatch import QueueDispatcher
+
 logger = logging.getLogger(__name__)
 
 
+class Delivery(object):
+    """
+    Handle returned for every queued message, reporting its delivery status.
+    """
+    QUEUED = 'queued'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    def __init__(self, message):
+        self.message = message
+        self.status = self.QUEUED
+        self.attempts = 0
+        self.error = None
+        self._done = threading.Event()
+
+    def settle(self, status, attempts, error=None):
+        self.status, self.attempts, self.error = status, attempts, error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Block until the message is sent or has failed, then return the status."""
+        self._done.wait(timeout)
+        return self.status
+
+    def __bool__(self):
+        return self.status != self.FAILED
+
+
+class MailDispatcher(QueueDispatcher):
+    """
+    Delivers queued messages in batches. Every worker keeps its own mail connection open for as long as
+    there are messages waiting, so a burst of mails shares one SMTP session (and one TLS handshake).
+    """
+
+    def __init__(self, batch_size=20, **kwargs):
+        super(MailDispatcher, self).__init__(self._send, on_success=self._sent, on_failure=self._failed, **kwargs)
+        self.batch_size = batch_size
+        self._local = threading.local()
+
+    def get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = get_connection(fail_silently=False)
+            self._local.connection = connection
+        # A no-op when the connection is already open
+        connection.open()
+        return connection
+
+    def close_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                logger.exception("Unable to close the mail connection.")
+
+    def _send(self, delivery):
+        try:
+            sent = self.get_connection().send_messages([delivery.message])
+        except Exception:
+            # Drop the session so the retry starts from a fresh connection
+            self.close_connection()
+            raise
+        if not sent:
+            raise RuntimeError("Mail backend did not accept the message.")
+
+    def _sent(self, delivery, attempts):
+        delivery.settle(Delivery.SENT, attempts)
+
+    def _failed(self, delivery, attempts, exc):
+        delivery.settle(Delivery.FAILED, attempts, error=str(exc))
+
+    def deliver_now(self, delivery):
+        """Deliver a message from the calling thread, without going through the queue."""
+        try:
+            return self.process(delivery)
+        finally:
+            self.close_connection()
+
+    def submit(self, item):
+        if self.workers <= 0:
+            self.deliver_now(item)
+            return True
+        return super(MailDispatcher, self).submit(item)
+
+    def _work(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for delivery in batch:
+                    self.process(delivery)
+            except Exception:
+                logger.exception("Unable to deliver the mail batch.")
+            finally:
+                if self.queue.empty():
+                    self.close_connection()
+                close_old_connections()
+                for _ in batch:
+                    self.queue.task_done()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = MailDispatcher(
+                    batch_size=settings.EMAIL_DISPATCH_BATCH_SIZE,
+                    workers=settings.EMAIL_DISPATCH_WORKERS,
+                    queue_size=settings.EMAIL_DISPATCH_QUEUE_SIZE,
+                    max_retries=settings.EMAIL_DISPATCH_MAX_RETRIES,
+                    backoff=settings.EMAIL_DISPATCH_RETRY_BACKOFF,
+                    name='mail-dispatcher',
+                )
+    return _dispatcher
+
+
+def enqueue(message):
+    """
+    Queue an `EmailMessage` for background delivery and return its `Delivery`.
+    If the queue is full the message is delivered inline instead of being dropped.
+    """
+    delivery = Delivery(message)
+    dispatcher = get_dispatcher()
+    if not dispatcher.submit(delivery):
+        dispatcher.deliver_now(delivery)
+    return delivery
+
+
 def send(to, subject, html_body, text_body=None, attachments=[], from_email=None, cc=None, bcc=None):
+    """
+    Queue a mail (see `enqueue`) and return its `Delivery`, or False if the message couldn't be built.
+    Like the True returned when mails were sent inline, the `Delivery` is truthy unless delivery failed;
+    call `wait()` on it to know the final status.
+    """
     if not (isinstance(to, list) or isinstance(to, tuple)):
         to = [to]
 
@@ -53,8 +203,7 @@ def send(to, subject, html_body, text_body=None, attachments=[], from_email=None
                     print(str(e))
                 attachment_name = os.path.split(attachment.name)[-1]
                 msg.attach(attachment_name or attachment.name, attachment.read())
-        msg.send()
-        return True
+        return enqueue(msg)
     except Exception:
         logger.exception("Unable to send the mail.")
         return False
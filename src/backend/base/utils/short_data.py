@@ -12,6 +12,16 @@ def get_first_name(email):
         return matchobj.group(1)
 
 
+def join_name(first_name, middle_name, last_name):
+    """
+    'first middle last', skipping empty parts
+    """
+    return ' '.join(part for part in (first_name, middle_name, last_name) if part)
+
+
+def get_display_name(full_name, email, username, mobile):
+    return full_name or email or username or mobile or ''
+
 
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -1,20 +1,166 @@
-import urllib.parse
-import requests
 import json
+import logging
+import threading
+import urllib.parse
+from datetime import timedelta
 
+import requests
 from decouple import config
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .dispatch import QueueDispatcher
+
+logger = logging.getLogger(__name__)
+
+SMS_JUST_URL = "http://www.smsjust.com/blank/sms/user/urlsms.php?username=whstlr&pass=nsts@123&response=Y" \
+               "&msgtype=UNI&senderid=WHSTLR&dest_mobileno={phone_no}&message={body}"
+
+
+class BaseSMSBackend(object):
+    """
+    Base class for SMS gateways. `send` must raise when the gateway did not accept the message.
+    """
+
+    def send(self, phone_no, body):
+        raise NotImplementedError('subclasses of BaseSMSBackend must override send()')
+
+
+class SMSJustBackend(BaseSMSBackend):
+    def send(self, phone_no, body):
+        res = requests.get(SMS_JUST_URL.format(phone_no=phone_no, body=urllib.parse.quote(str(body))),
+                           timeout=settings.SMS_TIMEOUT)
+        res.raise_for_status()
+        return res
+
+
+class GatewayBackend(BaseSMSBackend):
+    def send(self, phone_no, body):
+        res = requests.get(config('SMS_URL'),
+                           params={'user': config('SMS_USERNAME'),
+                                   'pwd': config('SMS_PASSWORD'),
+                                   'mobileno': phone_no,
+                                   'text': body,
+                                   'sender': config('SMS_SENDER_ID'),
+                                   'response': 'json'},
+                           timeout=settings.SMS_TIMEOUT)
+        res.raise_for_status()
+        return json.loads(res.content)
+
+
+class FakeSMSBackend(BaseSMSBackend):
+    """
+    Keeps sent messages in `FakeSMSBackend.outbox` instead of calling a gateway. Meant for tests.
+    """
+    outbox = []
+
+    def send(self, phone_no, body):
+        self.outbox.append({'phone_no': str(phone_no), 'body': body})
+
+
+_backend = None
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.SMS_BACKEND)()
+    return _backend
+
+
+def _deliver(item):
+    message_id, phone_no, body = item
+    get_backend().send(phone_no, body)
+
+
+def _stale(cutoff):
+    """Pending rows nobody picked up, and rows whose sender died before settling them."""
+    from ..models import SMSOutbox
+    return Q(status=SMSOutbox.PENDING, created_at__lt=cutoff) | Q(status=SMSOutbox.SENDING, modified_at__lt=cutoff)
+
+
+def _claim(item):
+    from ..models import SMSOutbox
+    return SMSOutbox.objects.filter(pk=item[0], status=SMSOutbox.PENDING).update(
+        status=SMSOutbox.SENDING, modified_at=timezone.now()) == 1
+
+
+def _claim_stale(item, cutoff):
+    from ..models import SMSOutbox
+    return SMSOutbox.objects.filter(_stale(cutoff), pk=item[0]).update(
+        status=SMSOutbox.SENDING, modified_at=timezone.now()) == 1
+
+
+# Settled rows are never sent again, so their body (OTPs among them) is blanked rather than kept around
+def _mark_sent(item, attempts):
+    from ..models import SMSOutbox
+    SMSOutbox.objects.filter(pk=item[0]).update(status=SMSOutbox.SENT, attempts=attempts, last_error='',
+                                                sent_at=timezone.now(), body='')
+
+
+def _mark_failed(item, attempts, exc):
+    from ..models import SMSOutbox
+    SMSOutbox.objects.filter(pk=item[0]).update(status=SMSOutbox.FAILED, attempts=attempts, last_error=str(exc),
+                                                body='')
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = QueueDispatcher(
+                    _deliver,
+                    workers=settings.SMS_DISPATCH_WORKERS,
+                    queue_size=settings.SMS_DISPATCH_QUEUE_SIZE,
+                    max_retries=settings.SMS_DISPATCH_MAX_RETRIES,
+                    backoff=settings.SMS_DISPATCH_RETRY_BACKOFF,
+                    name='sms-dispatcher',
+                    on_success=_mark_sent,
+                    on_failure=_mark_failed,
+                    claim=_claim,
+                )
+    return _dispatcher
+
+
+def enqueue_sms(phone_no, body):
+    """
+    Store the message in the outbox and hand it to the dispatcher once the surrounding transaction commits.
+    Messages the in-process queue could not take stay pending and are picked up by `flush_outbox`.
+    """
+    from ..models import SMSOutbox
+    message = SMSOutbox.objects.create(mobile=str(phone_no), body=body)
+    item = (message.pk, message.mobile, message.body)
+    transaction.on_commit(lambda: get_dispatcher().submit(item))
+    return message
+
+
+def flush_outbox():
+    """
+    Cron entry point: deliver messages left behind by a restart or a full queue.
+
+    Every row is claimed with a conditional UPDATE before it is sent, so overlapping cron runs and
+    dispatcher workers still holding the message in their queue never send it twice.
+    """
+    from ..models import SMSOutbox
+    cutoff = timezone.now() - timedelta(seconds=settings.SMS_OUTBOX_GRACE_SECONDS)
+    dispatcher = QueueDispatcher(_deliver, workers=0, max_retries=settings.SMS_DISPATCH_MAX_RETRIES,
+                                 backoff=settings.SMS_DISPATCH_RETRY_BACKOFF, name='sms-outbox',
+                                 on_success=_mark_sent, on_failure=_mark_failed,
+                                 claim=lambda item: _claim_stale(item, cutoff))
+    stale = SMSOutbox.objects.filter(_stale(cutoff)).order_by('pk').values_list('pk', 'mobile', 'body')
+    for item in stale.iterator():
+        dispatcher.submit(item)
+
+
 def send_sms_without_save(phone_no, body):
-    requests.get(
-        "http://www.smsjust.com/blank/sms/user/urlsms.php?username=whstlr&pass=nsts@123&response=Y&msgtype=UNI&senderid=WHSTLR&dest_mobileno=" + str(
-            phone_no) + "&message=" + urllib.parse.quote(str(body)))
+    SMSJustBackend().send(phone_no, body)
 
 
 def send_sms(phone_no, body):
-    res = requests.get(config('SMS_URL'),
-                       params={'user': config('SMS_USERNAME'),
-                               'pwd': config('SMS_PASSWORD'),
-                               'mobileno': phone_no,
-                               'text': body,
-                               'sender': config('SMS_SENDER_ID'),
-                               'response': 'json'})
-    return json.loads(res.content)
\ No newline at end of file
+    return GatewayBackend().send(phone_no, body)
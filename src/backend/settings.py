@@ -49,6 +49,7 @@ LIBS = (
 )
 
 APPS = (
+    'backend.base',
     'backend.accounts',
 )
 
@@ -58,6 +59,7 @@ INSTALLED_APPS = DJANGO_APPS + LIBS + APPS
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'backend.base.middleware.RateLimitMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -86,16 +88,38 @@ TEMPLATES = [
 
 CRONJOBS = [
     (config("CRON_AUTO_INSPECTION_TIME"), 'backend.admin_settings.crons.inspection_fix_cron', '>> /tmp/inspection_fix_cron.log 2>&1'),
+    (config("CRON_SMS_OUTBOX_TIME", default='*/5 * * * *'), 'backend.base.utils.sms.flush_outbox', '>> /tmp/sms_outbox_cron.log 2>&1'),
     ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'backend.accounts.authentication.CachedJWTAuthentication',
         # 'rest_framework.authentication.TokenAuthentication',
     ),
-    'DEFAULT_FILTER_BACKENDS': ('django_filters.rest_framework.DjangoFilterBackend',)
+    'DEFAULT_FILTER_BACKENDS': ('django_filters.rest_framework.DjangoFilterBackend',),
+    # Encode / decode with orjson when it is installed, the stdlib otherwise
+    'DEFAULT_RENDERER_CLASSES': (
+        'backend.base.api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'backend.base.api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+# Listings with more rows than this (by planner estimate) report the estimate instead of COUNT(*)
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = config('PAGINATION_COUNT_ESTIMATE_THRESHOLD', default=10000, cast=int)
+PAGINATION_COUNT_CACHE_TIMEOUT = config('PAGINATION_COUNT_CACHE_TIMEOUT', default=30, cast=int)
+# Rows fetched per round-trip when streaming ?pagination=false listings
+STREAMING_CHUNK_SIZE = config('STREAMING_CHUNK_SIZE', default=2000, cast=int)
+# Rows per INSERT / UPDATE statement in base.services.create_update_bulk_records
+BULK_WRITE_BATCH_SIZE = config('BULK_WRITE_BATCH_SIZE', default=500, cast=int)
+# Process pool for base.services.validate_bulk_records, used from BULK_VALIDATION_PROCESS_THRESHOLD records
+BULK_VALIDATION_PROCESSES = config('BULK_VALIDATION_PROCESSES', default=0, cast=int)
+BULK_VALIDATION_PROCESS_THRESHOLD = config('BULK_VALIDATION_PROCESS_THRESHOLD', default=5000, cast=int)
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(seconds=config('ACCESS_TOKEN_LIFETIME', cast=int)),
     'REFRESH_TOKEN_LIFETIME': timedelta(seconds=config('REFRESH_TOKEN_LIFETIME', cast=int)),
@@ -119,7 +143,7 @@ SIMPLE_JWT = {
 
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
-    'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
+    'TOKEN_USER_CLASS': 'backend.accounts.authentication.ClaimsUser',
 
     'JTI_CLAIM': 'jti',
 
@@ -142,6 +166,25 @@ DATABASES = {
     'default': dj_database_url.parse(config('APP_DATABASE_URL'))
 }
 
+# Cache
+# Local memory by default, point CACHE_BACKEND / CACHE_LOCATION at a shared cache
+# (e.g. django.core.cache.backends.redis.RedisCache or filebased.FileBasedCache) in production
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='backend-default'),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+        'KEY_PREFIX': config('CACHE_KEY_PREFIX', default='backend'),
+    }
+}
+# Cache used by backend.base.cache.Namespace
+BASE_CACHE_ALIAS = 'default'
+# Let CachedJWTAuthentication reuse user rows for USER_CACHE_TIMEOUT seconds; needs a shared CACHE_BACKEND
+USER_CACHE_ENABLED = config('USER_CACHE_ENABLED', default=False, cast=bool)
+USER_CACHE_TIMEOUT = config('USER_CACHE_TIMEOUT', default=60, cast=int)
+SWAGGER_CACHE_TIMEOUT = config('SWAGGER_CACHE_TIMEOUT', default=300, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -160,6 +203,23 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# The first hasher hashes new passwords, the others only verify existing hashes.
+# User.check_password rehashes with the first one on a successful login.
+
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='scrypt')
+PASSWORD_SCRYPT_WORK_FACTOR = config('PASSWORD_SCRYPT_WORK_FACTOR', default=2 ** 14, cast=int)
+PASSWORD_PBKDF2_ITERATIONS = config('PASSWORD_PBKDF2_ITERATIONS', default=600000, cast=int)
+_PASSWORD_HASHERS = {
+    'scrypt': 'backend.accounts.hashers.ScryptPasswordHasher',
+    'pbkdf2': 'backend.accounts.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
 AUTH_USER_MODEL = "accounts.User"
 
 # Internationalization
@@ -219,17 +279,71 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 EMAIL_PORT = config('EMAIL_PORT', cast=int)
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', cast=bool)
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
+
+# Background mail delivery, EMAIL_DISPATCH_WORKERS=0 sends inline
+EMAIL_DISPATCH_WORKERS = config('EMAIL_DISPATCH_WORKERS', default=1, cast=int)
+EMAIL_DISPATCH_QUEUE_SIZE = config('EMAIL_DISPATCH_QUEUE_SIZE', default=500, cast=int)
+EMAIL_DISPATCH_BATCH_SIZE = config('EMAIL_DISPATCH_BATCH_SIZE', default=20, cast=int)
+EMAIL_DISPATCH_MAX_RETRIES = config('EMAIL_DISPATCH_MAX_RETRIES', default=2, cast=int)
+EMAIL_DISPATCH_RETRY_BACKOFF = config('EMAIL_DISPATCH_RETRY_BACKOFF', default=1.0, cast=float)
 
 DEFAULT_EMAIL_FROM = config('DEFAULT_EMAIL_FROM')
 
 PASSWORD_RESET_URL = DOMAIN + "/password-reset/"
 PASSWORD_SESSION_EXPIRE = 0
 
+# 'stateless' logins only issue JWTs, 'session' also logs the user into a Django session
+AUTH_LOGIN_MODE = config('AUTH_LOGIN_MODE', default='stateless')
+# Sessions are only used by the admin, e.g. django.contrib.sessions.backends.signed_cookies or .cache
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.db')
+
 PASSWORD_RESET_TIME = 24 * 60 * 60
 
+# Rate limits of backend.base.middleware.RateLimitMiddleware
+# (path regex, identifier field in the body, limit per IP, limit per identifier, window in seconds)
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+# Proxies whose X-Real-IP header gives the client address; others are limited by REMOTE_ADDR
+RATE_LIMIT_TRUSTED_PROXIES = config('RATE_LIMIT_TRUSTED_PROXIES', default='', cast=lambda value: [
+    address.strip() for address in value.split(',') if address.strip()])
+RATE_LIMIT_RULES = [
+    (r'/users/login/?$', 'username', config('RATE_LIMIT_LOGIN_PER_IP', default=30, cast=int),
+     config('RATE_LIMIT_LOGIN_PER_IDENTIFIER', default=10, cast=int), 60),
+    (r'/users/(send_otp|resend_otp)/?$', 'mobile', config('RATE_LIMIT_OTP_PER_IP', default=10, cast=int),
+     config('RATE_LIMIT_OTP_PER_IDENTIFIER', default=5, cast=int), 60),
+    (r'/users/verify_otp/?$', 'mobile', config('RATE_LIMIT_OTP_PER_IP', default=10, cast=int),
+     config('RATE_LIMIT_OTP_PER_IDENTIFIER', default=5, cast=int), 60),
+]
+
+# Matches of a user search ranked by the in-process trigram index on SQLite (backend.accounts.search)
+USER_SEARCH_RANK_LIMIT = config('USER_SEARCH_RANK_LIMIT', default=200, cast=int)
+
+# Per-process user autocomplete index (backend.accounts.directory)
+AUTOCOMPLETE_INDEX_TTL = config('AUTOCOMPLETE_INDEX_TTL', default=300, cast=int)
+AUTOCOMPLETE_MAX_PENDING = config('AUTOCOMPLETE_MAX_PENDING', default=10000, cast=int)
+
+# OTP login
+# backend.accounts.otp.CacheOTPStore needs a shared cache (CACHE_BACKEND), the default keeps OTPs in the OTPLogin table
+OTP_STORE = config('OTP_STORE', default='backend.accounts.otp.DatabaseOTPStore')
+OTP_DAILY_LIMIT = config('OTP_DAILY_LIMIT', default=25, cast=int)
+OTP_RESEND_LIMIT = config('OTP_RESEND_LIMIT', default=25, cast=int)
+OTP_VALIDITY_MINUTES = config('OTP_VALIDITY_MINUTES', default=15, cast=int)
+
+# SMS Settings
+SMS_BACKEND = config('SMS_BACKEND', default='backend.base.utils.sms.SMSJustBackend')
+SMS_TIMEOUT = config('SMS_TIMEOUT', default=5, cast=int)
+SMS_DISPATCH_WORKERS = config('SMS_DISPATCH_WORKERS', default=2, cast=int)
+SMS_DISPATCH_QUEUE_SIZE = config('SMS_DISPATCH_QUEUE_SIZE', default=1000, cast=int)
+SMS_DISPATCH_MAX_RETRIES = config('SMS_DISPATCH_MAX_RETRIES', default=3, cast=int)
+SMS_DISPATCH_RETRY_BACKOFF = config('SMS_DISPATCH_RETRY_BACKOFF', default=1.0, cast=float)
+SMS_OUTBOX_GRACE_SECONDS = config('SMS_OUTBOX_GRACE_SECONDS', default=300, cast=int)
+
 # Logger Settings
 import logging.config
 
+SLACK_WEBHOOK_URL = config('SLACK_WEBHOOK_URL', default=None)
+
 LOGGING_CONFIG = None
 
 logging.config.dictConfig({
@@ -250,6 +364,9 @@ logging.config.dictConfig({
         'slack': {
             'level': 'ERROR',
             'class': 'backend.slack_logger.SlackExceptionHandler',
+            'queue_size': config('SLACK_LOG_QUEUE_SIZE', default=200, cast=int),
+            'coalesce_window': config('SLACK_LOG_COALESCE_WINDOW', default=60, cast=int),
+            'max_posts_per_minute': config('SLACK_LOG_MAX_POSTS_PER_MINUTE', default=20, cast=int),
         },
     },
     'loggers': {
@@ -1,140 +1,226 @@
-import requests
+import codecs
 import json
+import queue
+import threading
 import time
-import math
+from collections import deque
 from copy import copy
+
+import requests
 from django.conf import settings
 from django.utils.log import AdminEmailHandler
 from django.views.debug import ExceptionReporter
 
+# slack message attachment text has max of 8000 bytes
+# lets split it up into 7900 bytes long chunks to be on the safe side
+SLACK_CHUNK_SIZE = 7900
+
+
+def split_message(message, size=SLACK_CHUNK_SIZE):
+    """
+    Split `message` into chunks of at most `size` utf-8 bytes in a single pass over the encoded text.
+    A multi-byte character cut at a chunk boundary is carried over to the next chunk.
+    """
+    encoded = message.encode('utf8')
+    decoder = codecs.getincrementaldecoder('utf8')()
+    for start in range(0, len(encoded), size):
+        yield decoder.decode(encoded[start:start + size], final=start + size >= len(encoded))
+
 
 class SlackExceptionHandler(AdminEmailHandler):
+    """
+    Posts ERROR records to Slack from a background thread.
+
+    `emit` folds identical errors seen within `coalesce_window` seconds into a repeat count and caps
+    posts at `max_posts_per_minute`. For the records left, it renders the report in the logging thread,
+    while the request is still alive, and puts the finished payload on a bounded queue. The sender
+    thread only makes the HTTP call, so it never touches the request, the user or the database.
+    Payloads arriving while the queue is full are dropped and counted.
+    """
+
+    def __init__(self, include_html=False, email_backend=None, reporter_class=None, queue_size=200,
+                 coalesce_window=60, max_posts_per_minute=20, timeout=5):
+        super(SlackExceptionHandler, self).__init__(include_html, email_backend, reporter_class)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.coalesce_window = coalesce_window
+        self.max_posts_per_minute = max_posts_per_minute
+        self.timeout = timeout
+        self.dropped = 0
+        self.rate_limited = 0
+        self._recent = {}
+        self._posted_at = deque()
+        self._thread = None
+        self._lock = threading.Lock()
 
     # replacing default django emit (https://github.com/django/django/blob/master/django/utils/log.py)
     def emit(self, record, *args, **kwargs):
-        if not settings.DEBUG:
-            # original AdminEmailHandler "emit" method code (but without actually sending email)
+        if settings.DEBUG or not getattr(settings, 'SLACK_WEBHOOK_URL', None):
+            return
+        with self._lock:
+            repeats = self.coalesce(record)
+            if repeats is None or not self.allow_post():
+                return
+            dropped, self.dropped = self.dropped, 0
+            rate_limited, self.rate_limited = self.rate_limited, 0
+        try:
+            data = self.build_payload(record, repeats, dropped + rate_limited)
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            self.queue.put_nowait((record, data))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        self._ensure_sender()
+
+    def _ensure_sender(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._sender, name='slack-logger', daemon=True)
+                self._thread.start()
+
+    def _sender(self):
+        while True:
+            record, data = self.queue.get()
             try:
-                request = record.request
-                subject = '%s (%s IP): %s' % (
-                    record.levelname,
-                    ('internal' if request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
-                     else 'EXTERNAL'),
-                    record.getMessage()
-                )
+                self.post(data)
             except Exception:
-                subject = '%s: %s' % (
-                    record.levelname,
-                    record.getMessage()
-                )
-                request = None
-            subject = self.format_subject(subject)
-            # Since we add a nicely formatted traceback on our own, create a copy
-            # of the log record without the exception data.
-            no_exc_record = copy(record)
-            no_exc_record.exc_info = None
-            no_exc_record.exc_text = None
-
-            if record.exc_info:
-                exc_info = record.exc_info
-            else:
-                exc_info = (None, record.getMessage(), None)
-
-            reporter = ExceptionReporter(request, is_email=True, *exc_info)
-            message = "%s\n\n%s" % (self.format(no_exc_record), reporter.get_traceback_text())
-            html_message = reporter.get_traceback_html() if self.include_html else None
-
-            # self.send_mail(subject, message, fail_silently=True, html_message=html_message)
-
-            # this is where original "emit" method code ends
-
-            # construct slack attachment detail fields
-            attachments = [
-                {
-                    'title': subject,
-                    'color': 'danger',
-                    'fields': [
-                        {
-                            "title": "Level",
-                            "value": record.levelname,
-                            "short": True,
-                        },
-                        {
-                            "title": "Method",
-                            "value": request.method if request else 'No Request',
-                            "short": True,
-                        },
-                        {
-                            "title": "Path",
-                            "value": request.path if request else 'No Request',
-                            "short": True,
-                        },
-                        {
-                            "title": "User",
-                            "value": ((request.user.mobile + ' (' + str(request.user.pk) + ')'
-                                       if request.user.is_authenticated else 'Anonymous')
-                                      if request else 'No Request'),
-                            "short": True,
-                        },
-                        {
-                            "title": "Status Code",
-                            "value": record.status_code,
-                            "short": True,
-                        },
-                        {
-                            "title": "UA",
-                            "value": (request.META['HTTP_USER_AGENT']
-                                      if request and request.META else 'No Request'),
-                            "short": False,
-                        },
-                        {
-                            "title": 'GET Params',
-                            "value": json.dumps(request.GET) if request else 'No Request',
-                            "short": False,
-                        },
-                        {
-                            "title": "POST Data",
-                            "value": json.dumps(request.POST) if request else 'No Request',
-                            "short": False,
-                        }
-                    ],
-                },
-
-            ]
-
-            # add main error message body
-
-            # slack message attachment text has max of 8000 bytes
-            # lets split it up into 7900 bytes long chunks to be on the safe side
-            send = True
-            if send:
-                split = 7900
-                parts = range(math.ceil(len(message.encode('utf8')) / split))
-                for part in parts:
-                    start = 0 if part == 0 else split * part
-                    end = split if part == 0 else split * part + split
-
-                    # combine final text and prepend it with line breaks
-                    # so the details in slack message will fully collapse
-                    detail_text = '\r\n\r\n\r\n\r\n\r\n\r\n\r\n' + message[start:end]
-
-                    attachments.append({
-                        'color': 'danger',
-                        'title': 'Details (Part {})'.format(part + 1),
-                        'text': detail_text,
-                        'ts': time.time(),
-                    })
-
-                # construct main text
-                main_text = 'Error at ' + time.strftime("%A, %d %b %Y %H:%M:%S +0000", time.gmtime())
-
-                # construct data
-                data = {
-                    'payload': json.dumps({'main_text': main_text, 'attachments': attachments}),
-                }
-
-                # setup channel webhook
-                webhook_url = None
-
-                # send it
-                r = requests.post(webhook_url, data=data)
+                self.handleError(record)
+            finally:
+                self.queue.task_done()
+
+    def post(self, data):
+        requests.post(settings.SLACK_WEBHOOK_URL, data=data, timeout=self.timeout)
+
+    @staticmethod
+    def get_request_details(record):
+        request = getattr(record, 'request', None)
+        if request is None:
+            return None
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            user = '%s (%s)' % (getattr(user, 'mobile', '') or '', user.pk)
+        else:
+            user = 'Anonymous'
+        return {
+            'method': request.method,
+            'path': request.path,
+            'user': user,
+            'internal': request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS,
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            'get': json.dumps(request.GET),
+            'post': json.dumps(request.POST),
+        }
+
+    @staticmethod
+    def get_signature(record):
+        if record.exc_info and record.exc_info[2] is not None:
+            tb = record.exc_info[2]
+            while tb.tb_next is not None:
+                tb = tb.tb_next
+            return (record.exc_info[0], tb.tb_frame.f_code.co_filename, tb.tb_lineno)
+        return (record.levelname, record.pathname, record.lineno, record.msg)
+
+    def coalesce(self, record):
+        """
+        Returns None when the record repeats one posted less than `coalesce_window` seconds ago,
+        otherwise the number of repeats folded since the previous post of the same error.
+        """
+        now = time.monotonic()
+        signature = self.get_signature(record)
+        seen = self._recent.get(signature)
+        if seen and now - seen[0] < self.coalesce_window:
+            seen[1] += 1
+            return None
+        self._recent[signature] = [now, 0]
+        if len(self._recent) > 1000:
+            self._recent = {key: value for key, value in self._recent.items()
+                            if now - value[0] < self.coalesce_window}
+        return seen[1] if seen else 0
+
+    def allow_post(self):
+        now = time.monotonic()
+        while self._posted_at and now - self._posted_at[0] >= 60:
+            self._posted_at.popleft()
+        if len(self._posted_at) >= self.max_posts_per_minute:
+            self.rate_limited += 1
+            return False
+        self._posted_at.append(now)
+        return True
+
+    def build_payload(self, record, repeats, dropped):
+        try:
+            details = self.get_request_details(record)
+        except Exception:
+            details = None
+        request = getattr(record, 'request', None)
+        if details is not None:
+            subject = '%s (%s IP): %s' % (
+                record.levelname,
+                ('internal' if details['internal'] else 'EXTERNAL'),
+                record.getMessage()
+            )
+        else:
+            subject = '%s: %s' % (
+                record.levelname,
+                record.getMessage()
+            )
+            request = None
+        subject = self.format_subject(subject)
+        # Since we add a nicely formatted traceback on our own, create a copy
+        # of the log record without the exception data.
+        no_exc_record = copy(record)
+        no_exc_record.exc_info = None
+        no_exc_record.exc_text = None
+
+        if record.exc_info:
+            exc_info = record.exc_info
+        else:
+            exc_info = (None, record.getMessage(), None)
+
+        reporter = ExceptionReporter(request, is_email=True, *exc_info)
+        message = "%s\n\n%s" % (self.format(no_exc_record), reporter.get_traceback_text())
+
+        # construct slack attachment detail fields
+        no_request = 'No Request'
+        attachments = [
+            {
+                'title': subject,
+                'color': 'danger',
+                'fields': [
+                    {"title": "Level", "value": record.levelname, "short": True},
+                    {"title": "Method", "value": details['method'] if details else no_request, "short": True},
+                    {"title": "Path", "value": details['path'] if details else no_request, "short": True},
+                    {"title": "User", "value": details['user'] if details else no_request, "short": True},
+                    {"title": "Status Code", "value": getattr(record, 'status_code', None), "short": True},
+                    {"title": "Repeats", "value": repeats, "short": True},
+                    {"title": "Dropped", "value": dropped, "short": True},
+                    {"title": "UA", "value": details['user_agent'] if details else no_request, "short": False},
+                    {"title": 'GET Params', "value": details['get'] if details else no_request, "short": False},
+                    {"title": "POST Data", "value": details['post'] if details else no_request, "short": False},
+                ],
+            },
+        ]
+
+        # add main error message body
+        for part, chunk in enumerate(split_message(message)):
+            # combine final text and prepend it with line breaks
+            # so the details in slack message will fully collapse
+            attachments.append({
+                'color': 'danger',
+                'title': 'Details (Part {})'.format(part + 1),
+                'text': '\r\n\r\n\r\n\r\n\r\n\r\n\r\n' + chunk,
+                'ts': time.time(),
+            })
+
+        # construct main text
+        main_text = 'Error at ' + time.strftime("%A, %d %b %Y %H:%M:%S +0000", time.gmtime())
+
+        # construct data
+        return {
+            'payload': json.dumps({'main_text': main_text, 'attachments': attachments}),
+        }
@@ -47,8 +47,8 @@ urlpatterns = [
 
 if settings.DEBUG:
     swagger_url = [
-        re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-        re_path(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-        re_path(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+        re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=settings.SWAGGER_CACHE_TIMEOUT), name='schema-json'),
+        re_path(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=settings.SWAGGER_CACHE_TIMEOUT), name='schema-swagger-ui'),
+        re_path(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=settings.SWAGGER_CACHE_TIMEOUT), name='schema-redoc'),
     ]
     urlpatterns = urlpatterns + swagger_url